@@ -1,631 +1,1784 @@
 #!/usr/bin/python3.11
 # Version 1.26
 
+import heapq
 import random
-import os
-from prettytable import PrettyTable
+import struct
+import sys
+from array import array
+from collections import OrderedDict
+from collections.abc import MutableMapping
 
-os.system('clear')
+RESOURCES = ('brick', 'lumber', 'ore', 'grain', 'wool')
+RESOURCE_INDEX = {r: i for i, r in enumerate(RESOURCES)}
 
 SETTLEMENT_COST = {'brick': 1, 'lumber': 1, 'grain': 1, 'wool': 1}
 CITY_COST = {'ore': 3, 'grain': 2}
+ROAD_COST = {'brick': 1, 'lumber': 1}
+# Most of one resource a human can offer, ask for or add in a counter-offer
+MAX_TRADE_AMOUNT = 9999
+
+
+def cost_vector(cost):
+    # (resource index, amount) pairs, so affordability checks skip the name lookups
+    return tuple((RESOURCE_INDEX[r], amt) for r, amt in cost.items())
+
+
+SETTLEMENT_VECTOR = cost_vector(SETTLEMENT_COST)
+CITY_VECTOR = cost_vector(CITY_COST)
+ROAD_VECTOR = cost_vector(ROAD_COST)
+# Chance of each two-dice total
+DICE_ODDS = {n: (6 - abs(7 - n)) / 36 for n in range(2, 13)}
+
+# Most of each resource that a single settlement or city needs
+BUILD_CAPS = tuple(max(SETTLEMENT_COST.get(r, 0), CITY_COST.get(r, 0)) for r in RESOURCES)
+# The 36 equally likely outcomes of two dice
+DICE_TOTALS = tuple(a + b for a in range(1, 7) for b in range(1, 7))
+DICE_FIRST_BATCH = 16
+
+
+def derive_seed(seed, *keys):
+    # A reproducible seed for an independent stream (the dice, a worker, a game in a
+    # batch) derived from a base seed; None stays None so unseeded games stay random
+    if seed is None:
+        return None
+    return random.Random("/".join(str(k) for k in (seed,) + keys)).getrandbits(64)
+
+
+class DiceStream:
+    # Two-dice totals drawn in batches from their own rng. Batches start small, so
+    # short-lived search copies do not pay for rolls they never make, and grow up to
+    # max_batch for long games.
+    __slots__ = ('rng', 'rolls', 'batch', 'max_batch')
+
+    def __init__(self, rng, batch=DICE_FIRST_BATCH, max_batch=1024):
+        self.rng = rng
+        self.rolls = []
+        self.batch = batch
+        self.max_batch = max_batch
+
+    def roll(self):
+        rolls = self.rolls
+        if not rolls:
+            rolls.extend(self.rng.choices(DICE_TOTALS, k=self.batch))
+            if self.batch < self.max_batch:
+                self.batch *= 2
+        return rolls.pop()
+
+    def copy(self, rng=None):
+        # Without rng the copy rolls exactly what this stream would. With one it rolls
+        # fresh dice from it, so search copies cannot see the game's upcoming rolls.
+        clone = DiceStream.__new__(DiceStream)
+        if rng is None:
+            clone.rng = random.Random.__new__(random.Random)
+            clone.rng.setstate(self.rng.getstate())
+            clone.rolls = self.rolls[:]
+            clone.batch = self.batch
+        else:
+            clone.rng = rng
+            clone.rolls = []
+            clone.batch = DICE_FIRST_BATCH
+        clone.max_batch = self.max_batch
+        return clone
+
+
+class ResourceView(MutableMapping):
+    # Dict-style access to a player's resource counts, e.g. player.resources['ore']
+    __slots__ = ('_counts',)
+
+    def __init__(self, counts):
+        self._counts = counts
+
+    def __getitem__(self, resource):
+        return self._counts[RESOURCE_INDEX[resource]]
+
+    def __setitem__(self, resource, amount):
+        self._counts[RESOURCE_INDEX[resource]] = amount
+
+    def __delitem__(self, resource):
+        raise TypeError("resources cannot be removed")
+
+    def __contains__(self, resource):
+        return resource in RESOURCE_INDEX
+
+    def __iter__(self):
+        return iter(RESOURCES)
+
+    def __len__(self):
+        return len(RESOURCES)
+
+    def copy(self):
+        return dict(zip(RESOURCES, self._counts))
+
+    def __repr__(self):
+        return repr(self.copy())
+
 
 class Player:
+    __slots__ = ('name', 'counts', 'victory_points', 'settlements', 'cities', 'roads', 'is_human', 'personality')
+
     def __init__(self, name, is_human=False, personality=None):
         self.name = name
-        self.resources = {'brick': 0, 'lumber': 0, 'ore': 0, 'grain': 0, 'wool': 0}
+        # Resource counts in RESOURCES order
+        self.counts = array('i', bytes(4 * len(RESOURCES)))
         self.victory_points = 0
-        self.settlements = []
-        self.cities = []
+        self.settlements = array('H')
+        self.cities = array('H')
         self.roads = []
         self.is_human = is_human
         self.personality = personality
 
+    @property
+    def resources(self):
+        return ResourceView(self.counts)
+
+    @resources.setter
+    def resources(self, values):
+        for r, amt in values.items():
+            self.counts[RESOURCE_INDEX[r]] = amt
+
+    def copy(self):
+        clone = Player.__new__(Player)
+        clone.name = self.name
+        clone.counts = self.counts[:]
+        clone.victory_points = self.victory_points
+        clone.settlements = self.settlements[:]
+        clone.cities = self.cities[:]
+        clone.roads = self.roads[:]
+        clone.is_human = self.is_human
+        clone.personality = self.personality
+        return clone
+
     def add_resources(self, resource, amount):
-        self.resources[resource] += amount
+        self.counts[RESOURCE_INDEX[resource]] += amount
 
     def spend_resources(self, cost):
-        for resource, amt in cost.items():
-            if self.resources[resource] < amt:
+        vector = cost if type(cost) is tuple else cost_vector(cost)
+        counts = self.counts
+        for i, amt in vector:
+            if counts[i] < amt:
                 return False
-        for resource, amt in cost.items():
-            self.resources[resource] -= amt
+        for i, amt in vector:
+            counts[i] -= amt
         return True
 
     def show_resources(self):
-        return ', '.join([f"{k}: {v}" for k, v in self.resources.items()])
+        return ', '.join([f"{k}: {v}" for k, v in zip(RESOURCES, self.counts)])
 
     def missing_for_build(self, cost):
+        vector = cost if type(cost) is tuple else cost_vector(cost)
+        counts = self.counts
         missing = 0
-        for r, amt in cost.items():
-            if self.resources[r] < amt:
-                missing += (amt - self.resources[r])
+        for i, amt in vector:
+            if counts[i] < amt:
+                missing += (amt - counts[i])
         return missing
 
     def can_build(self, cost):
-        return all(self.resources[r] >= amt for r, amt in cost.items())
+        vector = cost if type(cost) is tuple else cost_vector(cost)
+        counts = self.counts
+        for i, amt in vector:
+            if counts[i] < amt:
+                return False
+        return True
 
-    def evaluate_trade_ai(self, offer, request, scarcity=False):
-        # AI logic as previously implemented, considering ratio, scarcity, personality, and building help
+    def evaluate_trade_ai(self, offer, request, rng, scarcity=False):
+        # AI logic considering ratio, personality, and building help. The decision only
+        # depends on the personality, the resource counts, the offer and the request, so
+        # it is cached; the counter-offer resource is still drawn from rng on every call.
+        counts = self.counts
         for r, amt in request.items():
-            if self.resources.get(r, 0) < amt:
+            if counts[RESOURCE_INDEX[r]] < amt:
                 return (False, None)
 
-        sum_offer = sum(offer.values())
-        sum_request = sum(request.values())
-        ratio = sum_offer / sum_request if sum_request > 0 else float('inf')
-
-        # Simulate post-trade resources
-        temp_res = self.resources.copy()
-        for r, a in request.items():
-            temp_res[r] -= a
-        for r, a in offer.items():
-            temp_res[r] += a
-
-        def missing_after_trade(temp_resources, cost):
-            m = 0
-            for r, amt in cost.items():
-                have = temp_resources.get(r, 0)
-                if have < amt:
-                    m += (amt - have)
-            return m
-
-        current_settlement_missing = self.missing_for_build(SETTLEMENT_COST)
-        current_city_missing = self.missing_for_build(CITY_COST)
-        settlement_missing_after = missing_after_trade(temp_res, SETTLEMENT_COST)
-        city_missing_after = missing_after_trade(temp_res, CITY_COST)
-        helps_settlement = (settlement_missing_after < current_settlement_missing)
-        helps_city = (city_missing_after < current_city_missing)
-
-        def propose_counter(offer, factor_increase=1):
-            offered_resources = [r for r, a in offer.items() if a > 0]
-            if offered_resources:
-                extra_res = random.choice(offered_resources)
-                counter_offer = offer.copy()
-                counter_offer[extra_res] += factor_increase
-                return counter_offer
-            else:
-                return None
-
-        if self.personality == "generous":
-            if ratio >= 1.0:
-                return (True, None)
-            else:
-                if helps_settlement or helps_city:
-                    return (True, None)
-                else:
-                    counter = propose_counter(offer, max(1, int((1.0 * sum_request - sum_offer))))
-                    return (False, counter) if counter else (False, None)
+        # Counts above what any build needs (plus what the trade takes away) cannot change
+        # the decision, so they are clamped to keep the key space small
+        caps = list(BUILD_CAPS)
+        for r, amt in request.items():
+            caps[RESOURCE_INDEX[r]] += amt
+        held = tuple(c if c < cap else cap for c, cap in zip(counts, caps))
+        key = (self.personality, held, tuple(offer.items()), tuple(request.items()))
+        decision = TRADE_CACHE.get(key)
+        if decision is None:
+            decision = decide_trade(self.personality, held, offer, request)
+            TRADE_CACHE.put(key, decision)
+
+        accepted, increase, offered_resources = decision
+        if accepted:
+            return (True, None)
+        if not offered_resources:
+            return (False, None)
+        counter = offer.copy()
+        counter[rng.choice(offered_resources)] += increase
+        return (False, counter)
+
+
+def missing_after_trade(temp_resources, vector):
+    m = 0
+    for i, amt in vector:
+        have = temp_resources[i]
+        if have < amt:
+            m += (amt - have)
+    return m
+
+
+# How each personality answers a trade offer. accept_ratio: what it wants back for
+# what it gives, offered / requested (strict: it wants strictly more). helps_ratio:
+# the ratio it settles for when the trade helps it towards a settlement or city.
+# counter_ratio: the ratio its counter-offers ask for otherwise; a counter for a
+# helpful trade asks for helps_ratio.
+TRADE_PROFILES = {
+    "generous": {'accept_ratio': 1.0, 'strict': False, 'helps_ratio': 0.0, 'counter_ratio': 1.0},
+    "fair": {'accept_ratio': 1.0, 'strict': False, 'helps_ratio': 0.9, 'counter_ratio': 1.0},
+    "greedy": {'accept_ratio': 1.0, 'strict': True, 'helps_ratio': 1.0, 'counter_ratio': 1.1},
+}
+# Personalities without a profile of their own
+DEFAULT_TRADE_PROFILE = {'accept_ratio': 1.0, 'strict': False, 'helps_ratio': 1.0, 'counter_ratio': 1.0}
+
+
+def set_trade_profile(personality, profile):
+    # Adds or replaces a personality's profile; cached decisions may be stale, so they go
+    TRADE_PROFILES[personality] = profile
+    TRADE_CACHE.clear()
+    TRADE_OFFER_ANSWERS.clear()
+
+
+def decide_trade(personality, counts, offer, request):
+    # Returns (accepted, counter increase, resources a counter may add to)
+    profile = TRADE_PROFILES.get(personality, DEFAULT_TRADE_PROFILE)
+    sum_offer = sum(offer.values())
+    sum_request = sum(request.values())
+    ratio = sum_offer / sum_request if sum_request > 0 else float('inf')
+    offered_resources = tuple(r for r, a in offer.items() if a > 0)
+
+    accept = profile['accept_ratio']
+    if ratio > accept or (ratio == accept and not profile['strict']):
+        return (True, 0, offered_resources)
+
+    # Simulate post-trade resources
+    temp_res = list(counts)
+    for r, a in request.items():
+        temp_res[RESOURCE_INDEX[r]] -= a
+    for r, a in offer.items():
+        temp_res[RESOURCE_INDEX[r]] += a
+
+    helps_settlement = missing_after_trade(temp_res, SETTLEMENT_VECTOR) < missing_after_trade(counts, SETTLEMENT_VECTOR)
+    helps_city = missing_after_trade(temp_res, CITY_VECTOR) < missing_after_trade(counts, CITY_VECTOR)
+
+    if helps_settlement or helps_city:
+        target = profile['helps_ratio']
+        if ratio >= target:
+            return (True, 0, offered_resources)
+    else:
+        target = profile['counter_ratio']
+    return (False, max(1, int((target * sum_request - sum_offer))), offered_resources)
+
+
+# Swaps an AI considers starting: one or two of a resource for one or two of another,
+# cheapest first. Each is (offer, request, change to the initiator's counts).
+TRADE_OFFERS = tuple(
+    ({give: give_amt}, {want: want_amt},
+     tuple(want_amt if r == want else -give_amt if r == give else 0 for r in RESOURCES))
+    for give_amt, want_amt in ((1, 1), (1, 2), (2, 1), (2, 2))
+    for give in RESOURCES
+    for want in RESOURCES
+    if give != want
+)
+# The same offers as (give index, amount, want index, amount)
+TRADE_OFFER_SWAPS = tuple(
+    (RESOURCE_INDEX[give], give_amt, RESOURCE_INDEX[want], want_amt)
+    for offer, request, _ in TRADE_OFFERS
+    for (give, give_amt), (want, want_amt) in [(*offer.items(), *request.items())]
+)
+SETTLEMENT_NEEDS = tuple(SETTLEMENT_COST.get(r, 0) for r in RESOURCES)
+CITY_NEEDS = tuple(CITY_COST.get(r, 0) for r in RESOURCES)
+# Counts above this change neither how much an offer helps nor how a partner answers
+# it, whatever the offer gives or takes away
+TRADE_OFFER_CAPS = tuple(cap + 2 for cap in BUILD_CAPS)
+# Chance a human partner takes a trade the AI offers
+HUMAN_ACCEPT_ODDS = 0.5
+# A pass brings a free resource, and one resource can at most bring the nearest build
+# and both builds one nearer (gain 4 + 2), so an AI only trades for more than that
+MIN_TRADE_GAIN = 6
+# Ranked offers by clamped hand, and every offer's answer by personality and clamped
+# hand; there are only a couple of thousand clamped hands
+TRADE_OFFER_RANKS = {}
+TRADE_OFFER_ANSWERS = {}
+UNKNOWN_ANSWER = 2
+
+
+def rank_trade_offers(held):
+    # Scores every TRADE_OFFERS entry for a hand at once: how much nearer it brings the
+    # nearest build, then both builds. Returns (gain, offer index) for the offers that
+    # help and that the hand can pay for, best first.
+    # Each resource's share of what is missing for a settlement and for a city, with
+    # 2 fewer to 2 more of it than the hand holds
+    shares = [
+        [(max(0, s - c), max(0, k - c)) for c in range(held[i] - 2, held[i] + 3)]
+        for i, s, k in zip(range(len(RESOURCES)), SETTLEMENT_NEEDS, CITY_NEEDS)
+    ]
+    settlement = sum(share[2][0] for share in shares)
+    city = sum(share[2][1] for share in shares)
+    nearest = min(settlement, city)
+    ranked = []
+    for index, (give, give_amt, want, want_amt) in enumerate(TRADE_OFFER_SWAPS):
+        if held[give] < give_amt:
+            continue
+        gave, kept = shares[give][2 - give_amt], shares[give][2]
+        got, had = shares[want][2 + want_amt], shares[want][2]
+        after_settlement = settlement + gave[0] - kept[0] + got[0] - had[0]
+        after_city = city + gave[1] - kept[1] + got[1] - had[1]
+        gain = 4 * (nearest - min(after_settlement, after_city)) + (settlement + city - after_settlement - after_city)
+        if gain > 0:
+            ranked.append((gain, index))
+    ranked.sort(key=lambda item: (-item[0], item[1]))
+    return tuple(ranked)
+
+
+def trade_offer_ranks(counts):
+    held = tuple(c if c < cap else cap for c, cap in zip(counts, TRADE_OFFER_CAPS))
+    ranked = TRADE_OFFER_RANKS.get(held)
+    if ranked is None:
+        ranked = TRADE_OFFER_RANKS[held] = rank_trade_offers(held)
+    return ranked
+
+
+class OfferAnswers:
+    # An AI partner's answers to the TRADE_OFFERS entries: 1 where it can supply the
+    # request and takes the offer as it stands, else 0. Answers are worked out when
+    # first asked for and shared by every partner with the same personality and
+    # clamped hand.
+    __slots__ = ('personality', 'held', 'known')
+
+    def __init__(self, personality, held):
+        self.personality = personality
+        self.held = held
+        self.known = bytearray([UNKNOWN_ANSWER]) * len(TRADE_OFFERS)
+
+    def __getitem__(self, index):
+        answer = self.known[index]
+        if answer == UNKNOWN_ANSWER:
+            offer, request, delta = TRADE_OFFERS[index]
+            # The partner's side of a trade is the initiator's change reversed
+            held = self.held
+            answer = int(min(h - d for h, d in zip(held, delta)) >= 0
+                         and decide_trade(self.personality, held, offer, request)[0])
+            self.known[index] = answer
+        return answer
+
+
+def trade_offer_answers(personality, counts):
+    held = tuple(c if c < cap else cap for c, cap in zip(counts, TRADE_OFFER_CAPS))
+    key = (personality, held)
+    answers = TRADE_OFFER_ANSWERS.get(key)
+    if answers is None:
+        answers = TRADE_OFFER_ANSWERS[key] = OfferAnswers(personality, held)
+    return answers
+
+
+def human_offer_answers(counts):
+    # A human's answers can only be guessed: HUMAN_ACCEPT_ODDS wherever they can supply
+    return tuple(
+        HUMAN_ACCEPT_ODDS if min(c - d for c, d in zip(counts, delta)) >= 0 else 0.0
+        for _, _, delta in TRADE_OFFERS
+    )
+
+
+def offer_acceptance(answers, index):
+    # Chance at least one partner takes offer `index`
+    refused = 1.0
+    for partner in answers:
+        refused *= 1.0 - partner[index]
+    return 1.0 - refused
+
+
+class LRUCache:
+    # Bounded least-recently-used store, with hit/miss counters
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return value
 
-        elif self.personality == "fair":
-            if ratio >= 1.0:
-                return (True, None)
-            else:
-                if helps_settlement or helps_city:
-                    if ratio >= 0.9:
-                        return (True, None)
-                    else:
-                        needed_increase = max(1, int((0.9 * sum_request - sum_offer)))
-                        counter = propose_counter(offer, needed_increase)
-                        return (False, counter) if counter else (False, None)
-                else:
-                    counter = propose_counter(offer, max(1, int((1.0 * sum_request - sum_offer))))
-                    return (False, counter) if counter else (False, None)
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self.entries[key] = value
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
 
-        elif self.personality == "greedy":
-            if ratio > 1.0:
-                return (True, None)
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries), 'maxsize': self.maxsize}
+
+
+# The old name, from when trade decisions were all it stored
+TradeCache = LRUCache
+# Decisions of the AI trade rules, shared by every game in the process
+TRADE_CACHE = LRUCache()
+
+
+# Kinds of game events
+TURN = 'turn'
+ROLL = 'roll'
+PRODUCE = 'produce'
+BUILD = 'build'
+TRADE_OFFER = 'trade_offer'
+TRADE_ACCEPT = 'trade_accept'
+TRADE_COUNTER = 'trade_counter'
+TRADE_DECLINE = 'trade_decline'
+TRADE_FAIL = 'trade_fail'
+PASS = 'pass'
+BONUS = 'bonus'
+STATE = 'state'
+MESSAGE = 'message'
+GAME_OVER = 'game_over'
+LONGEST_ROAD = 'longest_road'
+
+
+class Event:
+    __slots__ = ('kind', 'turn', 'player', 'data')
+
+    def __init__(self, kind, turn, player, data):
+        self.kind = kind
+        self.turn = turn
+        self.player = player
+        self.data = data
+
+    def to_dict(self):
+        row = {'kind': self.kind, 'turn': self.turn, 'player': self.player.name if self.player else None}
+        for k, v in self.data.items():
+            row[k] = v.name if isinstance(v, Player) else v
+        return row
+
+    def __repr__(self):
+        return f"Event({self.to_dict()!r})"
+
+
+class EventBus:
+    def __init__(self, sinks=()):
+        self.sinks = []
+        self.active = False
+        self.closed = False
+        for sink in sinks:
+            self.add(sink)
+
+    def add(self, sink):
+        # Disabled sinks are never called, so a bus holding only them stays inactive
+        # and the game skips building events altogether
+        if sink.enabled:
+            self.sinks.append(sink)
+            self.active = True
+
+    def attach(self, game):
+        for sink in self.sinks:
+            sink.attach(game)
+
+    def emit(self, event):
+        for sink in self.sinks:
+            sink.handle(event)
+
+    def close(self):
+        # Sinks are closed once, however often the game is
+        if not self.closed:
+            self.closed = True
+            for sink in self.sinks:
+                sink.close()
+
+
+class Sink:
+    enabled = True
+
+    def attach(self, game):
+        pass
+
+    def handle(self, event):
+        pass
+
+    def close(self):
+        pass
+
+
+class NullSink(Sink):
+    enabled = False
+
+
+class TerminalSink(Sink):
+    # Renders events as the classic terminal output
+    def __init__(self, write=print):
+        self.write = write
+        self.game = None
+        self.renderers = {
+            TURN: self.on_turn,
+            ROLL: self.on_roll,
+            PRODUCE: self.on_produce,
+            BUILD: self.on_build,
+            TRADE_ACCEPT: self.on_trade_accept,
+            TRADE_DECLINE: self.on_trade_decline,
+            TRADE_FAIL: self.on_trade_fail,
+            PASS: self.on_pass,
+            BONUS: self.on_bonus,
+            STATE: self.on_state,
+            MESSAGE: self.on_message,
+            GAME_OVER: self.on_game_over,
+            LONGEST_ROAD: self.on_longest_road,
+        }
+
+    def attach(self, game):
+        self.game = game
+
+    def handle(self, event):
+        render = self.renderers.get(event.kind)
+        if render:
+            render(event)
+
+    def on_turn(self, event):
+        self.write(f"\n{event.player.name}'s turn!")
+        self.write(self.game.render_board())
+
+    def on_roll(self, event):
+        roll = event.data['roll']
+        self.write("\n--- Dice Roll Explanation ---")
+        if roll == 7:
+            self.write("You rolled a 7. The robber would be activated (not yet implemented):")
+            self.write("- No hexes produce resources this turn.")
+            self.write("- The robber would move to a chosen hex, blocking it.")
+            self.write("- Players with >7 cards would discard half of them.")
+        else:
+            self.write(f"You rolled a {roll}. Any hex with number {roll} now produces resources for players")
+            self.write("with settlements (1 resource each) or cities (2 each) on that hex.")
+            self.write("Desert hexes never produce resources.")
+
+    def on_produce(self, event):
+        data = event.data
+        self.write(f"{event.player.name} collects {data['amount']} {data['resource']}(s) from hex {data['hex'] + 1}.")
+
+    def on_build(self, event):
+        item = event.data['item']
+        hex_number = event.data.get('hex')
+        edge = event.data.get('edge')
+        if event.player.is_human:
+            if item == 'settlement':
+                self.write(f"You built a settlement on hex {hex_number + 1}.")
+            elif item == 'city':
+                self.write(f"You upgraded the settlement on hex {hex_number + 1} to a city!")
             else:
-                if helps_settlement or helps_city:
-                    if ratio >= 1.0:
-                        return (True, None)
-                    else:
-                        needed_increase = max(1, int((1.0 * sum_request - sum_offer)))
-                        counter = propose_counter(offer, needed_increase)
-                        return (False, counter) if counter else (False, None)
-                else:
-                    needed_increase = max(1, int((1.1 * sum_request - sum_offer)))
-                    counter = propose_counter(offer, needed_increase)
-                    return (False, counter) if counter else (False, None)
+                self.write(f"You built a road between hexes {edge[0] + 1} and {edge[1] + 1}!")
         else:
-            # default to fair
-            if ratio >= 1.0:
-                return (True, None)
+            if item == 'settlement':
+                self.write(f"{event.player.name} built a settlement on hex {hex_number + 1}.")
+            elif item == 'city':
+                self.write(f"{event.player.name} upgraded a settlement on hex {hex_number + 1} to a city!")
             else:
-                counter = propose_counter(offer, max(1, int((1.0 * sum_request - sum_offer))))
-                return (False, counter) if counter else (False, None)
+                self.write(f"{event.player.name} built a road between hexes {edge[0] + 1} and {edge[1] + 1}.")
+
+    def on_trade_accept(self, event):
+        data = event.data
+        partner = data['partner']
+        if data['countered']:
+            self.write("Trade completed with new terms.")
+        else:
+            self.write(f"{partner.name} accepted the trade!")
+            self.write("Trade completed.")
+        if not event.player.is_human and not partner.is_human:
+            self.write(f"AI-to-AI trade: {event.player.name} gave {data['give']} to {partner.name} for {data['take']}.")
+
+    def on_trade_decline(self, event):
+        if event.data.get('counter'):
+            self.write(f"{event.player.name} (AI) declined the counter-offer.")
+        else:
+            self.write(f"{event.player.name} declined the trade.")
+
+    def on_trade_fail(self, event):
+        self.write("No one accepted your trade.")
+
+    def on_pass(self, event):
+        if event.player.is_human:
+            self.write("You passed your turn.")
+        else:
+            self.write(f"{event.player.name} decides to pass this turn.")
+
+    def on_bonus(self, event):
+        self.write(f"{event.player.name} received 1 {event.data['resource']} for passing!")
+
+    def on_state(self, event):
+        self.write(self.game.render_game_state())
+
+    def on_message(self, event):
+        self.write(event.data['text'])
+
+    def on_longest_road(self, event):
+        self.write(f"{event.player.name} takes the Longest Road ({event.data['length']} roads) for {LONGEST_ROAD_VP} VP!")
+
+    def on_game_over(self, event):
+        self.write(f"\nGame Over! {event.player.name} wins!")
+
+
+class JsonlSink(Sink):
+    # Writes one JSON object per event to a file path or an open text file
+    def __init__(self, target):
+        import json
+
+        self.dumps = json.dumps
+        self.owns_file = isinstance(target, str)
+        self.file = open(target, 'w') if self.owns_file else target
+        self.game = None
+
+    def attach(self, game):
+        self.game = game
+
+    def handle(self, event):
+        row = event.to_dict()
+        if event.kind == STATE:
+            row['players'] = [
+                {'name': p.name, 'resources': p.resources.copy(), 'victory_points': p.victory_points}
+                for p in self.game.players
+            ]
+        self.file.write(self.dumps(row) + "\n")
+
+    def close(self):
+        if self.owns_file:
+            self.file.close()
+        else:
+            self.file.flush()
+
+
+STATE_TABLE_FIELDS = [
+    "Player", "Brick", "Lumber", "Ore", "Grain", "Wool",
+    "Settlements", "Cities", "Roads", "Victory Points"
+]
+
+
+def render_state_table(rows):
+    # Imported here so headless games and plain imports never load prettytable
+    from prettytable import PrettyTable
+
+    table = PrettyTable()
+    table.field_names = STATE_TABLE_FIELDS
+    for row in rows:
+        table.add_row(row)
+    return str(table)
+
+
+# Resource codes used by the binary encoding; the desert is the last one
+BOARD_RESOURCES = RESOURCES + ('desert',)
+BOARD_RESOURCE_CODES = {r: i for i, r in enumerate(BOARD_RESOURCES)}
+ENCODING_MAGIC = b'CTN3'
+NO_SEAT = 0xFF
+# Seats are stored in one byte by encode() and the replay log, and NO_SEAT is taken
+MAX_PLAYERS = NO_SEAT
+
+STANDARD_BOARD_SIZE = 18
+MAX_BOARD_SIZE = 65535
+
+# Row and column steps to the six neighbors of a hex, for even and odd rows. Hexes
+# are laid out in rows with every odd row shifted half a hex to the right.
+NEIGHBOR_STEPS = (
+    ((0, -1), (0, 1), (-1, -1), (-1, 0), (1, -1), (1, 0)),
+    ((0, -1), (0, 1), (-1, 0), (-1, 1), (1, 0), (1, 1)),
+)
+
+
+def default_board_width(size):
+    # The classic board is drawn 4 hexes wide; bigger boards are roughly square
+    return max(4, int(size ** 0.5))
+
+
+def hex_adjacency(size, width):
+    # Compact adjacency graph of a board: the neighbors of hex h are
+    # targets[offsets[h]:offsets[h + 1]]
+    offsets = array('I', [0])
+    targets = array('I')
+    for h in range(size):
+        row, col = divmod(h, width)
+        for dr, dc in NEIGHBOR_STEPS[row & 1]:
+            r, c = row + dr, col + dc
+            if r >= 0 and 0 <= c < width:
+                n = r * width + c
+                if n < size:
+                    targets.append(n)
+        offsets.append(len(targets))
+    return offsets, targets
+
+
+# Roads run along board edges: between two neighboring hexes
+LONGEST_ROAD_MIN = 5
+LONGEST_ROAD_VP = 2
+# Road pieces each player has, as in Catan. This also keeps the Longest Road
+# search, which tries every trail, small.
+MAX_ROADS = 15
+
+
+def road_edge(a, b):
+    return (a, b) if a < b else (b, a)
+
+
+def trail_from(graph, node, used):
+    # Length of the longest trail (no road used twice) from node that avoids `used`
+    longest = 0
+    for n in graph[node]:
+        edge = (node, n) if node < n else (n, node)
+        if edge not in used:
+            used.add(edge)
+            length = 1 + trail_from(graph, n, used)
+            used.discard(edge)
+            if length > longest:
+                longest = length
+    return longest
+
+
+def longest_trail(graph):
+    # Longest trail in a player's road graph ({hex: [hexes joined by a road]})
+    return max((trail_from(graph, node, set()) for node in graph), default=0)
+
+
+def longest_trail_through(graph, a, b):
+    # Longest trail that uses road a-b. The road splits such a trail into a trail
+    # from a and a trail from b with no road in common, so every trail from a is
+    # paired with the longest trail from b that avoids it. Only the component the
+    # road is in is searched.
+    used = {road_edge(a, b)}
+    # Usually the road runs out to a new hex, and then the best trail just carries on from the other end
+    if len(graph[b]) == 1:
+        return 1 + trail_from(graph, a, used)
+    if len(graph[a]) == 1:
+        return 1 + trail_from(graph, b, used)
+    best = 0
+
+    def extend(node, length):
+        nonlocal best
+        total = length + 1 + trail_from(graph, b, used)
+        if total > best:
+            best = total
+        for n in graph[node]:
+            edge = (node, n) if node < n else (n, node)
+            if edge not in used:
+                used.add(edge)
+                extend(n, length + 1)
+                used.discard(edge)
+
+    extend(a, 0)
+    return best
+
+
+def score_board(board):
+    # Expected production of each hex, weighted up for resources that are scarce on
+    # this board. Deserts and 7s never produce and score 0.
+    supply = {r: 0.0 for r in RESOURCES}
+    for hex_ in board:
+        if hex_['resource'] != 'desert' and hex_['number'] != 7:
+            supply[hex_['resource']] += DICE_ODDS[hex_['number']]
+    average = sum(supply.values()) / len(RESOURCES)
+    scores = []
+    for hex_ in board:
+        if hex_['resource'] == 'desert' or hex_['number'] == 7:
+            scores.append(0.0)
+        else:
+            scores.append(DICE_ODDS[hex_['number']] * average / supply[hex_['resource']])
+    return tuple(scores)
+
+
+class GameResult:
+    def __init__(self, winner, turns, vp_history, seed=None, winner_seat=None):
+        self.winner = winner
+        self.winner_seat = winner_seat
+        self.turns = turns
+        self.vp_history = vp_history
+        self.seed = seed
+
+    def __repr__(self):
+        name = self.winner.name if self.winner else None
+        return f"GameResult(winner={name!r}, turns={self.turns}, seed={self.seed!r})"
 
 
 class Game:
-    def __init__(self, human_name):
-        self.players = [
-            Player(human_name, is_human=True),
-            Player("AI Player 1", personality="generous"),
-            Player("AI Player 2", personality="greedy"),
-            Player("AI Player 3", personality="fair")
-        ]
-        self.board = self.generate_board()
+    def __init__(self, human_name=None, seed=None, personalities=("generous", "greedy", "fair"), headless=False, sinks=None,
+                 search_budget=0.05, search_iterations=None, ask=None, board_size=STANDARD_BOARD_SIZE, board_width=None):
+        if headless and human_name is not None:
+            raise ValueError("a headless game cannot include a human player")
+        if not 1 <= board_size <= MAX_BOARD_SIZE:
+            raise ValueError(f"board size must be between 1 and {MAX_BOARD_SIZE}")
+        self.seed = seed
+        self.rng = random.Random(seed)
+        # The dice have their own stream, so the same seed rolls the same dice
+        # whatever the players decide
+        self.dice = DiceStream(random.Random(derive_seed(seed, 'dice')))
+        # Answers the prompts of human seats; the terminal unless another source is given
+        self.console = ask is None
+        self.ask = input if ask is None else ask
+        self.players = []
+        if human_name is not None:
+            self.players.append(Player(human_name, is_human=True))
+        for i, personality in enumerate(personalities, start=1):
+            self.players.append(Player(f"AI Player {i}", personality=personality))
+        if not 1 <= len(self.players) <= MAX_PLAYERS:
+            raise ValueError(f"a game needs between 1 and {MAX_PLAYERS} players")
+        self.board_width = board_width or default_board_width(board_size)
+        self.board = self.generate_board(board_size)
+        self.adjacency_offsets, self.adjacency = hex_adjacency(board_size, self.board_width)
+        # Hexes with at least one owner, in the order they were first settled
+        self.owned_hexes = []
+        # Rendered board rows by row number, dropped when a hex in the row changes
+        self.board_rows = {}
+        # dice number -> {hex index: [(player, resource, amount), ...]} for hexes that currently produce
+        self.production = {}
+        self.score_hexes()
+        self.rebuild_roads()
         self.turn_order = self.players[:]
         self.current_player_index = 0
         self.total_players = len(self.players)
+        self.turns_played = 0
+        self.vp_history = []
+        self.winner = None
+        if sinks is None:
+            sinks = [NullSink()] if headless else [TerminalSink()]
+        self.events = EventBus(sinks)
         self.distribute_starting_resources()
+        self.searchers = {}
+        self.setup_searchers(search_budget, search_iterations)
+        self.events.attach(self)
 
-    def roll_dice(self):
-        return random.randint(1, 6) + random.randint(1, 6)
+    def setup_searchers(self, budget=0.05, iterations=None):
+        # Players with the "mcts" personality choose their moves by tree search
+        for player in self.players:
+            if player.personality == "mcts" and player not in self.searchers:
+                from catan_mcts import MCTS
 
-    def generate_board(self):
-        resources = ['brick', 'lumber', 'ore', 'grain', 'wool', 'desert']
-        hexes = resources * 3
-        random.shuffle(hexes)
-        numbers = list(range(2, 13)) * 3
-        random.shuffle(numbers)
-        return [{'resource': resource, 'number': number, 'owner': []} for resource, number in zip(hexes, numbers)]
+                self.searchers[player] = MCTS(budget=budget, iterations=iterations, seed=self.rng.getrandbits(32))
 
-    def distribute_resources(self, roll):
-        if roll == 7:
-            print("\n--- Dice Roll Explanation ---")
-            print("You rolled a 7. The robber would be activated (not yet implemented):")
-            print("- No hexes produce resources this turn.")
-            print("- The robber would move to a chosen hex, blocking it.")
-            print("- Players with >7 cards would discard half of them.")
-            self.display_game_state()
-            return
+    def emit(self, kind, player=None, **data):
+        if self.events.active:
+            self.events.emit(Event(kind, self.turns_played, player, data))
 
-        print("\n--- Dice Roll Explanation ---")
-        print(f"You rolled a {roll}. Any hex with number {roll} now produces resources for players")
-        print("with settlements (1 resource each) or cities (2 each) on that hex.")
-        print("Desert hexes never produce resources.")
+    def say(self, *args):
+        if self.events.active:
+            self.events.emit(Event(MESSAGE, self.turns_played, None, {'text': ' '.join(str(a) for a in args)}))
 
-        for hex_number, hex_ in enumerate(self.board):
-            if hex_['number'] == roll and hex_['owner']:
-                for owner in hex_['owner']:
-                    base_amount = 0
-                    settle_count = (hex_number in owner.settlements)
-                    city_count = (hex_number in owner.cities)
+    def roll_dice(self):
+        return self.dice.roll()
 
-                    if settle_count:
-                        base_amount += 1
-                    if city_count:
-                        base_amount += 2
+    def generate_board(self, size=STANDARD_BOARD_SIZE):
+        # Equal shares of the six hex types and of the numbers 2-12; the classic
+        # board is 18 hexes, three of each type
+        resources = ['brick', 'lumber', 'ore', 'grain', 'wool', 'desert']
+        hexes = (resources * -(-size // len(resources)))[:size]
+        self.rng.shuffle(hexes)
+        numbers = list(range(2, 13)) * max(3, -(-size // 11))
+        self.rng.shuffle(numbers)
+        return [{'resource': resource, 'number': number, 'owner': []} for resource, number in zip(hexes, numbers)]
 
-                    if hex_['resource'] != 'desert' and base_amount > 0:
-                        owner.add_resources(hex_['resource'], base_amount)
-                        print(f"{owner.name} collects {base_amount} {hex_['resource']}(s) from hex {hex_number + 1}.")
+    def neighbors(self, hex_number):
+        offsets = self.adjacency_offsets
+        return self.adjacency[offsets[hex_number]:offsets[hex_number + 1]]
 
-        self.display_game_state()
+    def distribute_resources(self, roll):
+        active = self.events.active
+        if active:
+            self.emit(ROLL, self.turn_order[self.current_player_index], roll=roll)
+
+        if roll != 7:
+            producing = self.production.get(roll)
+            if producing:
+                for hex_number, entries in producing.items():
+                    for owner, resource, amount in entries:
+                        owner.add_resources(resource, amount)
+                        if active:
+                            self.emit(PRODUCE, owner, resource=resource, amount=amount, hex=hex_number)
+
+        if active:
+            self.emit(STATE)
+
+    def update_production(self, hex_number):
+        # Rebuild the production entries of one hex after a settlement or city changes on it
+        hex_ = self.board[hex_number]
+        entries = []
+        if hex_['resource'] != 'desert':
+            for owner in hex_['owner']:
+                amount = 0
+                if hex_number in owner.settlements:
+                    amount += 1
+                if hex_number in owner.cities:
+                    amount += 2
+                if amount > 0:
+                    entries.append((owner, hex_['resource'], amount))
+
+        producing = self.production.setdefault(hex_['number'], {})
+        if entries:
+            producing[hex_number] = entries
+        else:
+            producing.pop(hex_number, None)
 
     def distribute_starting_resources(self):
         for player in self.players:
-            total_resources = 5
-            resource_types = list(player.resources.keys())
-            while total_resources > 0:
-                resource = random.choice(resource_types)
+            for resource in self.rng.choices(RESOURCES, k=5):
                 player.add_resources(resource, 1)
-                total_resources -= 1
-
-    def display_board(self):
-        print("\n--- Board ---")
-        grid_size = 4
-        for i in range(0, len(self.board), grid_size):
-            row = self.board[i:i + grid_size]
-            row_display = []
-            for j, hex_ in enumerate(row):
-                hex_index = i + j
-                owner_str_list = []
-                for owner in hex_['owner']:
-                    if hex_index in owner.cities:
-                        owner_str_list.append(f"{owner.name}(C)")
-                    elif hex_index in owner.settlements:
-                        owner_str_list.append(f"{owner.name}(S)")
-                    else:
-                        owner_str_list.append(f"{owner.name}")
 
-                owners_str = ""
-                if owner_str_list:
-                    owners_str = " Owners: " + ", ".join(owner_str_list)
+    def render_board(self):
+        # Rows are cached, so only rows with a new settlement or city are redrawn
+        lines = ["\n--- Board ---"]
+        rows = self.board_rows
+        for row_number in range((len(self.board) + self.board_width - 1) // self.board_width):
+            row = rows.get(row_number)
+            if row is None:
+                row = rows[row_number] = self.render_board_row(row_number)
+            lines.append(row)
+        return "\n".join(lines)
+
+    def render_board_row(self, row_number):
+        grid_size = self.board_width
+        i = row_number * grid_size
+        row = self.board[i:i + grid_size]
+        row_display = []
+        for j, hex_ in enumerate(row):
+            hex_index = i + j
+            owner_str_list = []
+            for owner in hex_['owner']:
+                if hex_index in owner.cities:
+                    owner_str_list.append(f"{owner.name}(C)")
+                elif hex_index in owner.settlements:
+                    owner_str_list.append(f"{owner.name}(S)")
+                else:
+                    owner_str_list.append(f"{owner.name}")
+
+            owners_str = ""
+            if owner_str_list:
+                owners_str = " Owners: " + ", ".join(owner_str_list)
+
+            cell_str = f"[{hex_index+1}] {hex_['resource']} ({hex_['number']}){owners_str}"
+            row_display.append(cell_str.ljust(40))
+        return ' '.join(row_display)
+
+    def render_game_state(self):
+        return render_state_table([self.state_row(player) for player in self.players])
+
+    def state_row(self, player):
+        # One player's row of the game state table
+        return [
+            player.name,
+            *player.counts,
+            len(player.settlements),
+            len(player.cities),
+            len(player.roads),
+            player.victory_points,
+        ]
 
-                cell_str = f"[{hex_index+1}] {hex_['resource']} ({hex_['number']}){owners_str}"
-                row_display.append(cell_str.ljust(40))
-            print(' '.join(row_display))
+    def display_board(self):
+        print(self.render_board())
 
     def display_game_state(self):
-        table = PrettyTable()
-        table.field_names = [
-            "Player", "Brick", "Lumber", "Ore", "Grain", "Wool", 
-            "Settlements", "Cities", "Roads", "Victory Points"
-        ]
-        for player in self.players:
-            table.add_row([
-                player.name,
-                player.resources['brick'],
-                player.resources['lumber'],
-                player.resources['ore'],
-                player.resources['grain'],
-                player.resources['wool'],
-                len(player.settlements),
-                len(player.cities),
-                len(player.roads),
-                player.victory_points,
-            ])
-        print(table)
+        print(self.render_game_state())
+
+    def run_steps(self, steps):
+        # Drives one of the *_steps generators below: every prompt it yields is
+        # answered with self.ask and the generator's return value is returned.
+        # The game server drives the same generators with answers from the network.
+        try:
+            prompt = next(steps)
+            while True:
+                prompt = steps.send(self.ask(prompt))
+        except StopIteration as done:
+            return done.value
 
     def take_turn(self):
+        return self.run_steps(self.turn_steps())
+
+    def turn_steps(self):
         player = self.turn_order[self.current_player_index]
-        print(f"\n{player.name}'s turn!")
-        self.display_board()
+        self.emit(TURN, player)
 
         roll = self.roll_dice()
         self.distribute_resources(roll)
 
         if player.is_human:
-            self.human_action(player)
+            yield from self.human_steps(player)
         else:
-            self.ai_action(player)
+            yield from self.ai_steps(player)
 
     def give_random_resource(self, player):
-        resource_types = list(player.resources.keys())
-        chosen_resource = random.choice(resource_types)
+        resource_types = RESOURCES
+        chosen_resource = self.rng.choice(resource_types)
         player.add_resources(chosen_resource, 1)
-        print(f"{player.name} received 1 {chosen_resource} for passing!")
+        self.emit(BONUS, player, resource=chosen_resource)
 
     def handle_build_action(self, player):
-        print("\n1. Build Settlement (Cost: 1 brick, 1 lumber, 1 grain, 1 wool)")
-        print("2. Build Road (Cost: 1 brick, 1 lumber)")
-        print("3. Upgrade Settlement to City (Cost: 3 ore, 2 grain, must have a settlement first)")
-        choice = input("What do you want to build? ").strip()
+        return self.run_steps(self.build_steps(player))
+
+    def build_steps(self, player):
+        self.say("\n1. Build Settlement (Cost: 1 brick, 1 lumber, 1 grain, 1 wool)")
+        self.say("2. Build Road (Cost: 1 brick, 1 lumber)")
+        self.say("3. Upgrade Settlement to City (Cost: 3 ore, 2 grain, must have a settlement first)")
+        choice = (yield "What do you want to build? ").strip()
         if choice == "1":
-            if player.spend_resources({'brick': 1, 'lumber': 1, 'grain': 1, 'wool': 1}):
-                print("\nChoose a hex number to place your settlement.")
+            # Resources are only spent once the choice is valid, so a bad answer costs nothing
+            if player.can_build(SETTLEMENT_VECTOR):
+                self.say("\nChoose a hex number to place your settlement.")
                 try:
-                    hex_number = int(input("Enter hex number: ")) - 1
+                    hex_number = int((yield "Enter hex number: ")) - 1
                 except ValueError:
-                    print("Invalid number.")
+                    self.say("Invalid number.")
                     return False
                 if 0 <= hex_number < len(self.board):
-                    self.board[hex_number]['owner'].append(player)
-                    player.settlements.append(hex_number)
-                    player.victory_points += 1
-                    print(f"You built a settlement on hex {hex_number + 1}.")
-                    self.display_game_state()
+                    player.spend_resources(SETTLEMENT_VECTOR)
+                    self.place_settlement(player, hex_number)
+                    self.emit(STATE)
                     return True
                 else:
-                    print("Invalid hex.")
+                    self.say("Invalid hex.")
                     return False
             else:
-                print("Not enough resources to build a settlement!")
+                self.say("Not enough resources to build a settlement!")
                 return False
         elif choice == "2":
-            if player.spend_resources({'brick': 1, 'lumber': 1}):
-                player.roads.append("road")
-                print("You built a road!")
-                self.display_game_state()
-                return True
-            else:
-                print("Not enough resources to build a road!")
+            if not player.can_build(ROAD_VECTOR):
+                self.say("Not enough resources to build a road!")
+                return False
+            if len(player.roads) >= MAX_ROADS:
+                self.say(f"You have built all {MAX_ROADS} of your roads!")
+                return False
+            options = self.road_options(player)
+            if not options:
+                self.say("Roads must join one of your settlements, cities or roads, and there is nowhere to build one.")
+                return False
+            self.say("\nYou can build a road between these hexes:", ", ".join(f"{a + 1}-{b + 1}" for a, b in options[:30]))
+            try:
+                start = int((yield "Enter the hex number the road starts from: ")) - 1
+                end = int((yield "Enter the neighboring hex number it runs to: ")) - 1
+            except ValueError:
+                self.say("Invalid number.")
+                return False
+            edge = road_edge(start, end)
+            if edge not in options:
+                self.say("You cannot build a road there.")
                 return False
+            player.spend_resources(ROAD_VECTOR)
+            self.build_road(player, edge)
+            self.emit(STATE)
+            return True
         elif choice == "3":
             if len(player.settlements) == 0:
-                print("You don't have any settlements to upgrade!")
+                self.say("You don't have any settlements to upgrade!")
                 return False
             else:
-                if player.spend_resources({'ore': 3, 'grain': 2}):
-                    print("\nChoose one of your existing settlement hex numbers to upgrade to a city.")
-                    print("Your settlements are on these hexes:", [h+1 for h in player.settlements])
+                if player.can_build(CITY_VECTOR):
+                    self.say("\nChoose one of your existing settlement hex numbers to upgrade to a city.")
+                    self.say("Your settlements are on these hexes:", [h+1 for h in player.settlements])
                     try:
-                        hex_choice = int(input("Enter hex number: ")) - 1
+                        hex_choice = int((yield "Enter hex number: ")) - 1
                     except ValueError:
-                        print("Invalid number.")
+                        self.say("Invalid number.")
                         return False
                     if hex_choice in player.settlements:
-                        player.settlements.remove(hex_choice)
-                        player.cities.append(hex_choice)
-                        player.victory_points += 1
-                        print(f"You upgraded the settlement on hex {hex_choice + 1} to a city!")
-                        self.display_game_state()
+                        player.spend_resources(CITY_VECTOR)
+                        self.upgrade_to_city(player, hex_choice)
+                        self.emit(STATE)
                         return True
                     else:
-                        print("You do not have a settlement on that hex.")
+                        self.say("You do not have a settlement on that hex.")
                         return False
                 else:
-                    print("Not enough resources to upgrade to a city!")
+                    self.say("Not enough resources to upgrade to a city!")
                     return False
         else:
-            print("Invalid choice.")
+            self.say("Invalid choice.")
             return False
 
     def human_action(self, player):
+        return self.run_steps(self.human_steps(player))
+
+    def human_steps(self, player):
         action_taken = False
         while True:
-            print("\nActions: 1. Build  2. Pass  3. Trade")
-            action = input("Choose an action: ").strip()
+            self.say("\nActions: 1. Build  2. Pass  3. Trade")
+            action = (yield "Choose an action: ").strip()
 
             if action == "1":
-                build_success = self.handle_build_action(player)
+                build_success = yield from self.build_steps(player)
                 if build_success:
                     break
                 else:
                     continue
             elif action == "2":
-                print("You passed your turn.")
+                self.emit(PASS, player)
                 if not action_taken:
                     self.give_random_resource(player)
-                self.display_game_state()
+                self.emit(STATE)
                 break
             elif action == "3":
-                trade_success = self.trade_resources(initiator=player)
-                self.display_game_state()
+                trade_success = yield from self.trade_steps(player)
+                self.emit(STATE)
                 if trade_success:
                     action_taken = True
                     continue
                 else:
                     continue
             else:
-                print("Invalid action.")
+                self.say("Invalid action.")
                 continue
 
+    def score_hexes(self):
+        # The board never changes after generation, so the scores and the best-first
+        # order are computed once and shared with clones
+        self.hex_scores = score_board(self.board)
+        self.placement_order = tuple(sorted(range(len(self.board)), key=lambda i: -self.hex_scores[i]))
+        self.rebuild_placement()
+
+    def rebuild_placement(self):
+        # Per player: how far down placement_order every hex is already theirs, and a
+        # heap of their settlements by score for picking city upgrades
+        self.placement_cursor = {}
+        self.city_heaps = {}
+        for player in self.players:
+            heap = [(-self.hex_scores[h], h) for h in player.settlements]
+            heapq.heapify(heap)
+            self.city_heaps[player] = heap
+
+    def best_settlement_hex(self, player):
+        order = self.placement_order
+        board = self.board
+        i = self.placement_cursor.get(player, 0)
+        # Hexes only ever gain owners, so the cursor never has to move back
+        while i < len(order) and player in board[order[i]]['owner']:
+            i += 1
+        self.placement_cursor[player] = i
+        return order[i] if i < len(order) else order[0]
+
+    def best_city_hex(self, player):
+        heap = self.city_heaps[player]
+        while heap and heap[0][1] not in player.settlements:
+            heapq.heappop(heap)
+        return heap[0][1] if heap else None
+
     def ai_build(self, player):
-        if player.spend_resources({'brick':1,'lumber':1,'grain':1,'wool':1}):
-            possible_hexes = [i for i, h in enumerate(self.board) if player not in h['owner']]
-            if not possible_hexes:
-                possible_hexes = list(range(len(self.board)))
-            chosen_hex = random.choice(possible_hexes)
-            self.board[chosen_hex]['owner'].append(player)
-            player.settlements.append(chosen_hex)
-            player.victory_points += 1
-            print(f"{player.name} built a settlement on hex {chosen_hex + 1}.")
+        if player.spend_resources(SETTLEMENT_VECTOR):
+            self.place_settlement(player, self.best_settlement_hex(player))
             return True
 
-        if player.settlements and player.spend_resources({'ore':3,'grain':2}):
-            chosen_hex = random.choice(player.settlements)
-            player.settlements.remove(chosen_hex)
-            player.cities.append(chosen_hex)
-            player.victory_points += 1
-            print(f"{player.name} upgraded a settlement on hex {chosen_hex + 1} to a city!")
+        if player.settlements and player.spend_resources(CITY_VECTOR):
+            self.upgrade_to_city(player, self.best_city_hex(player))
             return True
 
-        if player.spend_resources({'brick':1,'lumber':1}):
-            player.roads.append("road")
-            print(f"{player.name} built a road.")
-            return True
+        if player.can_build(ROAD_VECTOR):
+            edge = self.best_road_edge(player)
+            if edge is not None:
+                player.spend_resources(ROAD_VECTOR)
+                self.build_road(player, edge)
+                return True
 
         return False
 
+    def place_settlement(self, player, hex_number):
+        hex_ = self.board[hex_number]
+        if hex_['owner']:
+            hex_['owner'].append(player)
+        else:
+            # Clones share unowned hexes with the game they were copied from, so the
+            # first owner gets a fresh hex of its own
+            self.board[hex_number] = {'resource': hex_['resource'], 'number': hex_['number'], 'owner': [player]}
+            self.owned_hexes.append(hex_number)
+        self.board_rows.pop(hex_number // self.board_width, None)
+        player.settlements.append(hex_number)
+        self.update_production(hex_number)
+        heapq.heappush(self.city_heaps[player], (-self.hex_scores[hex_number], hex_number))
+        player.victory_points += 1
+        self.emit(BUILD, player, item='settlement', hex=hex_number)
+
+    def upgrade_to_city(self, player, hex_number):
+        player.settlements.remove(hex_number)
+        heap = self.city_heaps[player]
+        if heap and heap[0][1] == hex_number:
+            heapq.heappop(heap)
+        player.cities.append(hex_number)
+        self.update_production(hex_number)
+        self.board_rows.pop(hex_number // self.board_width, None)
+        player.victory_points += 1
+        self.emit(BUILD, player, item='city', hex=hex_number)
+
+    def rebuild_roads(self, holder=None):
+        # Road lookups from the players' road lists, after setup, restore or decode
+        self.road_owner = {}
+        self.road_graph = {}
+        self.longest_roads = {}
+        for player in self.players:
+            graph = self.road_graph[player] = {}
+            for a, b in player.roads:
+                self.road_owner[(a, b)] = player
+                graph.setdefault(a, []).append(b)
+                graph.setdefault(b, []).append(a)
+            self.longest_roads[player] = longest_trail(graph)
+        self.longest_road_holder = holder
+
+    def road_options(self, player):
+        # Free edges touching the player's settlements, cities or roads; none once
+        # the player has built all MAX_ROADS roads
+        if len(player.roads) >= MAX_ROADS:
+            return []
+        nodes = set(self.road_graph[player])
+        nodes.update(player.settlements)
+        nodes.update(player.cities)
+        owner = self.road_owner
+        offsets = self.adjacency_offsets
+        adjacency = self.adjacency
+        options = []
+        for node in nodes:
+            for i in range(offsets[node], offsets[node + 1]):
+                n = adjacency[i]
+                edge = (node, n) if node < n else (n, node)
+                if edge not in owner:
+                    options.append(edge)
+        options.sort()
+        return options
+
+    def best_road_edge(self, player):
+        # Prefer roads that lengthen a road from one of its ends onto a hex the player
+        # has not reached yet, then roads towards better hexes
+        graph = self.road_graph[player]
+        built = set(graph)
+        built.update(player.settlements)
+        built.update(player.cities)
+        scores = self.hex_scores
+        best = None
+        best_key = None
+        for edge in self.road_options(player):
+            for start, end in (edge, edge[::-1]):
+                if start not in built:
+                    continue
+                key = (end not in graph and len(graph.get(start, ())) <= 1, end not in graph, scores[end])
+                if best_key is None or key > best_key:
+                    best, best_key = edge, key
+        return best
+
+    def build_road(self, player, edge):
+        a, b = edge = road_edge(*edge)
+        player.roads.append(edge)
+        self.road_owner[edge] = player
+        graph = self.road_graph[player]
+        graph.setdefault(a, []).append(b)
+        graph.setdefault(b, []).append(a)
+        self.emit(BUILD, player, item='road', edge=edge)
+        # Only a trail through the new road can beat the player's old longest
+        length = longest_trail_through(graph, a, b)
+        if length > self.longest_roads[player]:
+            self.longest_roads[player] = length
+            self.award_longest_road(player)
+
+    def award_longest_road(self, player):
+        # The longest road of at least LONGEST_ROAD_MIN is worth LONGEST_ROAD_VP; a tie
+        # leaves it with the player who got there first
+        holder = self.longest_road_holder
+        length = self.longest_roads[player]
+        if holder is player or length < LONGEST_ROAD_MIN:
+            return
+        if holder is not None:
+            if length <= self.longest_roads[holder]:
+                return
+            holder.victory_points -= LONGEST_ROAD_VP
+        player.victory_points += LONGEST_ROAD_VP
+        self.longest_road_holder = player
+        self.emit(LONGEST_ROAD, player, length=length, previous=holder)
+
     def ai_action(self, player):
+        return self.run_steps(self.ai_steps(player))
+
+    def ai_steps(self, player):
+        # Only a trade offered to a human seat ever prompts during an AI turn
+        searcher = self.searchers.get(player)
+        if searcher is not None:
+            yield from self.search_steps(player, searcher)
+            return
+
         action_taken = False
         if self.ai_build(player):
-            print(f"{player.name} ended their turn after building.")
+            if self.events.active:
+                self.say(f"{player.name} ended their turn after building.")
             action_taken = True
         else:
-            if random.choice([True, False]):
-                if self.ai_trade_resources(player):
+            if self.rng.random() < 0.5:
+                if (yield from self.ai_trade_steps(player)):
                     action_taken = True
                 else:
-                    print(f"{player.name} decides to pass this turn.")
+                    self.emit(PASS, player)
                     if not action_taken:
                         self.give_random_resource(player)
             else:
-                print(f"{player.name} decides to pass this turn.")
+                self.emit(PASS, player)
                 if not action_taken:
                     self.give_random_resource(player)
 
-        self.display_game_state()
+        self.emit(STATE)
+
+    def search_action(self, player, searcher):
+        return self.run_steps(self.search_steps(player, searcher))
+
+    def search_steps(self, player, searcher):
+        # Like a human turn: any number of trade attempts (up to the searcher's limit),
+        # then a build or a pass
+        traded = False
+        attempts = 0
+        while True:
+            move = searcher.choose(self, player, traded, attempts)
+            if move[0] == 'trade':
+                attempts += 1
+                if (yield from self.move_steps(player, move)):
+                    traded = True
+                continue
+            yield from self.move_steps(player, move, traded)
+            break
+        self.emit(STATE)
+
+    def play_move(self, player, move, traded=False):
+        return self.run_steps(self.move_steps(player, move, traded))
+
+    def move_steps(self, player, move, traded=False):
+        # Applies a move from catan_mcts.legal_moves; returns whether a trade went through
+        kind = move[0]
+        if kind == 'trade':
+            return (yield from self.trade_steps(player, {move[1]: 1}, {move[2]: 1}))
+        if kind == 'settlement':
+            player.spend_resources(SETTLEMENT_VECTOR)
+            self.place_settlement(player, move[1])
+        elif kind == 'city':
+            player.spend_resources(CITY_VECTOR)
+            self.upgrade_to_city(player, move[1])
+        elif kind == 'road':
+            player.spend_resources(ROAD_VECTOR)
+            self.build_road(player, move[1])
+        else:
+            self.emit(PASS, player)
+            if not traded:
+                self.give_random_resource(player)
+        return False
 
     def trade_resources(self, initiator, initiator_offer=None, initiator_request=None):
-        if initiator_offer is None or initiator_request is None:
-            # Human-initiated trade
-            print("You have the following resources:")
-            print(initiator.show_resources())
-            offer_res = input("Which resource do you offer? (brick/lumber/ore/grain/wool): ").strip().lower()
-            if offer_res not in initiator.resources:
-                print("Invalid resource type.")
-                return False
-            try:
-                offer_amt = int(input(f"How many {offer_res} do you offer?: ").strip())
-            except ValueError:
-                print("Invalid number.")
-                return False
-            if initiator.resources.get(offer_res, 0) < offer_amt:
-                print("You do not have enough resources to offer that trade.")
-                return False
+        return self.run_steps(self.trade_steps(initiator, initiator_offer, initiator_request))
 
-            request_res = input("Which resource do you want in return?: ").strip().lower()
-            if request_res not in initiator.resources:
-                print("Invalid resource type.")
-                return False
-            try:
-                request_amt = int(input(f"How many {request_res} do you want?: ").strip())
-            except ValueError:
-                print("Invalid number.")
+    def trade_steps(self, initiator, initiator_offer=None, initiator_request=None):
+        if initiator_offer is None or initiator_request is None:
+            terms = yield from self.trade_terms_steps(initiator)
+            if terms is None:
                 return False
-
-            original_offer = {offer_res: offer_amt}
-            original_request = {request_res: request_amt}
+            original_offer, original_request = terms
         else:
             original_offer = initiator_offer
             original_request = initiator_request
 
-        suppliers = 0
-        for p in self.players:
-            if p is not initiator:
-                can_supply = True
-                for r, a in original_request.items():
-                    if p.resources.get(r, 0) < a:
-                        can_supply = False
-                        break
-                if can_supply:
-                    suppliers += 1
-
-        scarcity = (suppliers == 1)
-
-        # Attempt trade with each other player
-        for potential_partner in self.players:
-            if potential_partner is not initiator:
-                if potential_partner.is_human:
-                    print(f"\n{initiator.name} offers {original_offer} and wants {original_request} from {potential_partner.name}.")
-                    decision = input("Do you accept this trade? (y/n/c for counter): ").strip().lower()
-                    if decision == 'y':
-                        if initiator.spend_resources(original_offer):
-                            if potential_partner.spend_resources(original_request):
-                                for r, a in original_request.items():
-                                    initiator.add_resources(r, a)
-                                for r, a in original_offer.items():
-                                    potential_partner.add_resources(r, a)
-                                print(f"{potential_partner.name} accepted the trade!")
-                                print("Trade completed successfully.")
-                                return True
-                            else:
-                                print(f"{potential_partner.name} can't complete the trade.")
-                                for r, a in original_offer.items():
-                                    initiator.add_resources(r, a)
-                                continue
-                        else:
-                            print(f"{initiator.name} no longer has the resources.")
-                            return False
-                    elif decision == 'c':
-                        print("Enter your counter-offer. You can add more demanded resources from the initiator.")
-                        new_offer_res = input("Which resource do you want more of from the initiator?: ").strip().lower()
-                        if new_offer_res not in initiator.resources:
-                            print("Invalid resource.")
-                            continue
-                        try:
-                            additional_amount = int(input("How many additional units?: ").strip())
-                        except ValueError:
-                            print("Invalid number.")
-                            continue
-
-                        counter = original_offer.copy()
-                        counter[new_offer_res] = counter.get(new_offer_res, 0) + additional_amount
-
-                        # If initiator is human, ask them; if AI, evaluate AI logic
-                        if initiator.is_human:
-                            print(f"{potential_partner.name} proposes a counter-offer: {counter} instead of {original_offer}")
-                            ans = input("Do you accept this counter-offer? (y/n): ").strip().lower()
-                            if ans == 'y':
-                                if initiator.spend_resources(counter):
-                                    if potential_partner.spend_resources(original_request):
-                                        for r,a in original_request.items():
-                                            initiator.add_resources(r,a)
-                                        for r,a in counter.items():
-                                            potential_partner.add_resources(r,a)
-                                        print("Trade completed with the new terms.")
-                                        return True
-                                    else:
-                                        print(f"{potential_partner.name} can't fulfill request.")
-                                        for r,a in counter.items():
-                                            initiator.add_resources(r,a)
-                                        continue
-                                else:
-                                    print("Initiator doesn't have enough resources.")
-                                    continue
-                            else:
-                                print("Counter-offer declined.")
-                                continue
-                        else:
-                            # Initiator is AI, evaluate AI logic
-                            accepted, ai_counter = initiator.evaluate_trade_ai(counter, original_request, scarcity=scarcity)
-                            if accepted:
-                                if initiator.spend_resources(counter):
-                                    if potential_partner.spend_resources(original_request):
-                                        for r,a in original_request.items():
-                                            initiator.add_resources(r,a)
-                                        for r,a in counter.items():
-                                            potential_partner.add_resources(r,a)
-                                        print("Trade completed with new terms.")
-                                        if not initiator.is_human and not potential_partner.is_human:
-                                            print(f"AI-to-AI trade: {initiator.name} gave {counter} to {potential_partner.name} for {original_request}.")
-                                        return True
-                                    else:
-                                        print(f"{potential_partner.name} can't pay.")
-                                        for r,a in counter.items():
-                                            initiator.add_resources(r,a)
-                                        continue
-                                else:
-                                    print(f"{initiator.name} cannot afford the counter offer.")
-                                    continue
-                            else:
-                                print(f"{initiator.name} (AI) declined the counter-offer.")
-                                continue
+        self.emit(TRADE_OFFER, initiator, offer=original_offer, request=original_request)
+        request_vector = cost_vector(original_request)
+        suppliers = [p for p in self.players if p is not initiator and p.can_build(request_vector)]
+        scarcity = (len(suppliers) == 1)
+
+        # Gather every supplier's answer in one pass. Nobody can beat an acceptance of
+        # the original terms, so that settles the trade straight away.
+        counters = []
+        for partner in suppliers:
+            if partner.is_human:
+                accepted, counter = yield from self.human_response_steps(partner, initiator, original_offer, original_request)
+            else:
+                accepted, counter = self.trade_response(partner, initiator, original_offer, original_request, scarcity)
+            if accepted:
+                if self.transfer(initiator, original_offer, partner, original_request):
+                    self.emit(TRADE_ACCEPT, initiator, partner=partner, give=original_offer, take=original_request, countered=False)
+                    return True
+                self.say(f"{initiator.name} no longer has the resources.")
+                return False
+            if counter is not None:
+                self.emit(TRADE_COUNTER, partner, initiator=initiator, counter=counter, request=original_request)
+                if initiator.can_build(cost_vector(counter)):
+                    counters.append((sum(counter.values()), len(counters), partner, counter))
+                elif self.events.active:
+                    self.say(f"{initiator.name} cannot afford the counter offer from {partner.name}.")
+
+        # Otherwise offer the initiator the feasible counters, cheapest first
+        counters.sort(key=lambda c: (c[0], c[1]))
+        for _, _, partner, counter in counters:
+            if initiator.is_human:
+                accepted = yield from self.human_counter_steps(initiator, partner, counter)
+            else:
+                accepted = self.accepts_counter(initiator, partner, counter, original_request, scarcity)
+            if accepted:
+                if self.transfer(initiator, counter, partner, original_request):
+                    self.emit(TRADE_ACCEPT, initiator, partner=partner, give=counter, take=original_request, countered=True)
+                    return True
 
-                    else:
-                        print(f"{potential_partner.name} declined the trade.")
-                        continue
+        self.emit(TRADE_FAIL, initiator, offer=original_offer, request=original_request)
+        return False
 
-                else:
-                    # AI partner
-                    accepted, counter = potential_partner.evaluate_trade_ai(original_offer, original_request, scarcity=scarcity)
-                    if accepted:
-                        if initiator.spend_resources(original_offer):
-                            if potential_partner.spend_resources(original_request):
-                                for r, a in original_request.items():
-                                    initiator.add_resources(r, a)
-                                for r, a in original_offer.items():
-                                    potential_partner.add_resources(r, a)
-                                print(f"{potential_partner.name} accepted the trade!")
-                                print("Trade completed.")
-                                if not initiator.is_human and not potential_partner.is_human:
-                                    print(f"AI-to-AI trade: {initiator.name} gave {original_offer} to {potential_partner.name} for {original_request}.")
-                                return True
-                            else:
-                                print(f"{potential_partner.name} can't complete the trade.")
-                                for r, a in original_offer.items():
-                                    initiator.add_resources(r, a)
-                                continue
-                        else:
-                            print("Initiator no longer has resources.")
-                            return False
-                    else:
-                        if counter is not None:
-                            if initiator.is_human:
-                                print(f"{potential_partner.name} proposes a counter-offer: {counter}")
-                                ans = input("Accept counter? (y/n): ").strip().lower()
-                                if ans == 'y':
-                                    if initiator.spend_resources(counter):
-                                        if potential_partner.spend_resources(original_request):
-                                            for r,a in original_request.items():
-                                                initiator.add_resources(r,a)
-                                            for r,a in counter.items():
-                                                potential_partner.add_resources(r,a)
-                                            print("Trade completed with new terms.")
-                                            if not initiator.is_human and not potential_partner.is_human:
-                                                print(f"AI-to-AI trade: {initiator.name} gave {counter} to {potential_partner.name} for {original_request}.")
-                                            return True
-                                        else:
-                                            print(f"{potential_partner.name} can't fulfill request.")
-                                            for r,a in counter.items():
-                                                initiator.add_resources(r,a)
-                                            continue
-                                    else:
-                                        print("Initiator can't afford counter.")
-                                        continue
-                                else:
-                                    print("Counter-offer declined.")
-                                    continue
-                            else:
-                                # AI initiator declines counters
-                                print(f"{initiator.name} (AI) declines the counter-offer.")
-                                continue
-                        else:
-                            print(f"{potential_partner.name} declined the trade.")
-                            continue
-
-        print("No one accepted your trade.")
+    def ask_trade_terms(self, initiator):
+        return self.run_steps(self.trade_terms_steps(initiator))
+
+    def trade_terms_steps(self, initiator):
+        self.say("You have the following resources:")
+        self.say(initiator.show_resources())
+        offer_res = (yield "Which resource do you offer? (brick/lumber/ore/grain/wool): ").strip().lower()
+        if offer_res not in initiator.resources:
+            self.say("Invalid resource type.")
+            return None
+        try:
+            offer_amt = int((yield f"How many {offer_res} do you offer?: ").strip())
+        except ValueError:
+            self.say("Invalid number.")
+            return None
+        if not 1 <= offer_amt <= MAX_TRADE_AMOUNT:
+            self.say("Invalid number.")
+            return None
+        if initiator.resources.get(offer_res, 0) < offer_amt:
+            self.say("You do not have enough resources to offer that trade.")
+            return None
+
+        request_res = (yield "Which resource do you want in return?: ").strip().lower()
+        if request_res not in initiator.resources:
+            self.say("Invalid resource type.")
+            return None
+        try:
+            request_amt = int((yield f"How many {request_res} do you want?: ").strip())
+        except ValueError:
+            self.say("Invalid number.")
+            return None
+        if not 1 <= request_amt <= MAX_TRADE_AMOUNT:
+            self.say("Invalid number.")
+            return None
+
+        return ({offer_res: offer_amt}, {request_res: request_amt})
+
+    def trade_response(self, partner, initiator, offer, request, scarcity):
+        if partner.is_human:
+            return self.run_steps(self.human_response_steps(partner, initiator, offer, request))
+        accepted, counter = partner.evaluate_trade_ai(offer, request, scarcity=scarcity, rng=self.rng)
+        if not accepted and counter is None:
+            self.emit(TRADE_DECLINE, partner, initiator=initiator)
+        return (accepted, counter)
+
+    def human_response_steps(self, partner, initiator, offer, request):
+        self.say(f"\n{initiator.name} offers {offer} and wants {request} from {partner.name}.")
+        decision = (yield "Do you accept this trade? (y/n/c for counter): ").strip().lower()
+        if decision == 'y':
+            return (True, None)
+        if decision == 'c':
+            self.say("Enter your counter-offer. You can add more demanded resources from the initiator.")
+            new_offer_res = (yield "Which resource do you want more of from the initiator?: ").strip().lower()
+            if new_offer_res not in initiator.resources:
+                self.say("Invalid resource.")
+                return (False, None)
+            try:
+                additional_amount = int((yield "How many additional units?: ").strip())
+            except ValueError:
+                self.say("Invalid number.")
+                return (False, None)
+            if not 1 <= additional_amount <= MAX_TRADE_AMOUNT:
+                self.say("Invalid number.")
+                return (False, None)
+            counter = offer.copy()
+            counter[new_offer_res] = counter.get(new_offer_res, 0) + additional_amount
+            return (False, counter)
+
+        self.emit(TRADE_DECLINE, partner, initiator=initiator)
+        return (False, None)
+
+    def accepts_counter(self, initiator, partner, counter, request, scarcity):
+        if initiator.is_human:
+            return self.run_steps(self.human_counter_steps(initiator, partner, counter))
+
+        # AI initiators weigh a human's counter with their own trade rules and do not
+        # haggle with other AIs
+        accepted = False
+        if partner.is_human:
+            accepted, _ = initiator.evaluate_trade_ai(counter, request, scarcity=scarcity, rng=self.rng)
+        if not accepted:
+            self.emit(TRADE_DECLINE, initiator, partner=partner, counter=counter)
+        return accepted
+
+    def human_counter_steps(self, initiator, partner, counter):
+        self.say(f"{partner.name} proposes a counter-offer: {counter}")
+        if (yield "Accept counter? (y/n): ").strip().lower() == 'y':
+            return True
+        self.say("Counter-offer declined.")
         return False
 
+    def transfer(self, initiator, give, partner, take):
+        # Both sides are checked before anything moves, so a failed trade never needs a refund
+        give_vector = cost_vector(give)
+        take_vector = cost_vector(take)
+        if not initiator.can_build(give_vector) or not partner.can_build(take_vector):
+            return False
+        mine = initiator.counts
+        theirs = partner.counts
+        for i, amt in give_vector:
+            mine[i] -= amt
+            theirs[i] += amt
+        for i, amt in take_vector:
+            theirs[i] -= amt
+            mine[i] += amt
+        return True
+
     def ai_trade_resources(self, player):
-        possible_resources = ['brick','lumber','ore','grain','wool']
-        ai_offer_res = random.choice(possible_resources)
-        ai_request_res = random.choice([r for r in possible_resources if r != ai_offer_res])
-        ai_offer_amt = 1
-        ai_request_amt = 1
+        return self.run_steps(self.ai_trade_steps(player))
 
-        if player.resources.get(ai_offer_res, 0) < ai_offer_amt:
+    def ai_trade_steps(self, player):
+        best = self.best_trade_offer(player)
+        if best is None:
             return False
+        offer, request = best
+        return (yield from self.trade_steps(initiator=player, initiator_offer=offer, initiator_request=request))
+
+    def partner_answers(self, initiator):
+        # Every other seat's answers to all of TRADE_OFFERS. AI partners answer by their
+        # trade profiles, which everyone knows.
+        return [
+            human_offer_answers(p.counts) if p.is_human else trade_offer_answers(p.personality, p.counts)
+            for p in self.players if p is not initiator
+        ]
 
-        return self.trade_resources(
-            initiator=player,
-            initiator_offer={ai_offer_res: ai_offer_amt},
-            initiator_request={ai_request_res: ai_request_amt}
+    def score_trade_offers(self, player):
+        # Expected gain of every TRADE_OFFERS entry for the player, in order
+        answers = self.partner_answers(player)
+        scores = [0.0] * len(TRADE_OFFERS)
+        for gain, index in trade_offer_ranks(player.counts):
+            scores[index] = gain * offer_acceptance(answers, index)
+        return scores
+
+    def best_trade_offer(self, player):
+        # The (offer, request) with the best expected gain, or None when no offer beats
+        # MIN_TRADE_GAIN. Offers are tried best gain first, so the search stops as soon
+        # as no later offer could do better.
+        answers = None
+        best = None
+        best_score = MIN_TRADE_GAIN
+        for gain, index in trade_offer_ranks(player.counts):
+            if gain <= best_score:
+                break
+            if answers is None:
+                answers = self.partner_answers(player)
+            score = gain * offer_acceptance(answers, index)
+            if score > best_score:
+                best, best_score = index, score
+        if best is None:
+            return None
+        offer, request, _ = TRADE_OFFERS[best]
+        return offer, request
+
+    def clone(self, seed=None, sinks=None):
+        # Copies the game without deepcopy: players are copied field by field and
+        # board owners and production entries are remapped to the copies by seat.
+        # The copy keeps the rng and dice state unless a new seed is given.
+        game = Game.__new__(Game)
+        players = [p.copy() for p in self.players]
+        seat = {id(p): i for i, p in enumerate(self.players)}
+        if seed is None:
+            game.seed = self.seed
+            game.rng = random.Random.__new__(random.Random)
+            game.rng.setstate(self.rng.getstate())
+            game.dice = self.dice.copy()
+        else:
+            # A reseeded copy only needs one rng; its dice come from the same one
+            game.seed = seed
+            game.rng = random.Random(seed)
+            game.dice = self.dice.copy(game.rng)
+        game.console = False
+        game.ask = self.ask
+        game.players = players
+        # Unowned hexes are shared, owned ones are copied with their owners remapped
+        game.board = self.board[:]
+        for h in self.owned_hexes:
+            hex_ = self.board[h]
+            game.board[h] = {'resource': hex_['resource'], 'number': hex_['number'],
+                             'owner': [players[seat[id(o)]] for o in hex_['owner']]}
+        game.owned_hexes = self.owned_hexes[:]
+        game.board_width = self.board_width
+        game.adjacency_offsets = self.adjacency_offsets
+        game.adjacency = self.adjacency
+        game.board_rows = {}
+        game.production = {
+            number: {
+                hex_number: [(players[seat[id(o)]], r, a) for o, r, a in entries]
+                for hex_number, entries in producing.items()
+            }
+            for number, producing in self.production.items()
+        }
+        game.hex_scores = self.hex_scores
+        game.placement_order = self.placement_order
+        game.placement_cursor = {players[seat[id(p)]]: i for p, i in self.placement_cursor.items()}
+        game.city_heaps = {players[seat[id(p)]]: heap[:] for p, heap in self.city_heaps.items()}
+        game.road_owner = {edge: players[seat[id(p)]] for edge, p in self.road_owner.items()}
+        game.road_graph = {
+            players[seat[id(p)]]: {node: joined[:] for node, joined in graph.items()}
+            for p, graph in self.road_graph.items()
+        }
+        game.longest_roads = {players[seat[id(p)]]: length for p, length in self.longest_roads.items()}
+        holder = self.longest_road_holder
+        game.longest_road_holder = players[seat[id(holder)]] if holder else None
+        game.turn_order = [players[seat[id(p)]] for p in self.turn_order]
+        game.current_player_index = self.current_player_index
+        game.total_players = self.total_players
+        game.turns_played = self.turns_played
+        game.vp_history = self.vp_history[:]
+        game.winner = players[seat[id(self.winner)]] if self.winner else None
+        # Copies play every seat with the built-in AI, which is what search rollouts need
+        game.searchers = {}
+        game.events = EventBus(sinks or ())
+        game.events.attach(game)
+        return game
+
+    def snapshot(self):
+        # Immutable record of everything that changes during play, for restore()
+        seat = {id(p): i for i, p in enumerate(self.players)}
+        owners = tuple((h, tuple(seat[id(o)] for o in self.board[h]['owner'])) for h in self.owned_hexes)
+        players = tuple(
+            (p.counts.tobytes(), p.victory_points, p.settlements.tobytes(), p.cities.tobytes(), tuple(p.roads))
+            for p in self.players
         )
+        holder = seat[id(self.longest_road_holder)] if self.longest_road_holder else None
+        return (owners, players, self.current_player_index, self.turns_played, holder)
+
+    def restore(self, snapshot):
+        owners, players, self.current_player_index, self.turns_played, holder = snapshot
+        for player, (counts, vp, settlements, cities, roads) in zip(self.players, players):
+            player.counts = array('i', counts)
+            player.victory_points = vp
+            player.settlements = array('H', settlements)
+            player.cities = array('H', cities)
+            player.roads = list(roads)
+        board = self.board
+        for h in self.owned_hexes:
+            board[h] = {'resource': board[h]['resource'], 'number': board[h]['number'], 'owner': []}
+        self.owned_hexes = []
+        self.production = {}
+        for hex_number, seats in owners:
+            hex_ = board[hex_number]
+            board[hex_number] = {'resource': hex_['resource'], 'number': hex_['number'],
+                                 'owner': [self.players[i] for i in seats]}
+            self.owned_hexes.append(hex_number)
+            self.update_production(hex_number)
+        self.board_rows = {}
+        self.rebuild_placement()
+        self.rebuild_roads(self.players[holder] if holder is not None else None)
+        self.winner = None
+        for player in self.players:
+            if player.victory_points >= 10:
+                self.winner = player
+                break
+
+    def encode(self):
+        # Compact little-endian encoding of the board, players and turn position
+        out = bytearray(ENCODING_MAGIC)
+        seat = {id(p): i for i, p in enumerate(self.players)}
+        holder = seat[id(self.longest_road_holder)] if self.longest_road_holder else NO_SEAT
+        out += struct.pack('<HBBIHB', len(self.board), len(self.players), self.current_player_index, self.turns_played,
+                           self.board_width, holder)
+        for hex_ in self.board:
+            out += struct.pack('<BBB', BOARD_RESOURCE_CODES[hex_['resource']], hex_['number'], len(hex_['owner']))
+            out += bytes(seat[id(o)] for o in hex_['owner'])
+        for player in self.players:
+            name = player.name.encode()
+            personality = (player.personality or '').encode()
+            out += struct.pack('<BB', len(name), len(personality)) + name + personality
+            out += struct.pack('<?B5HHHH', player.is_human, player.victory_points, *player.counts,
+                               len(player.settlements), len(player.cities), len(player.roads))
+            out += struct.pack(f'<{len(player.settlements)}H', *player.settlements)
+            out += struct.pack(f'<{len(player.cities)}H', *player.cities)
+            out += struct.pack(f'<{2 * len(player.roads)}H', *(h for edge in player.roads for h in edge))
+        return bytes(out)
+
+    @classmethod
+    def decode(cls, data, seed=None, sinks=None):
+        if data[:4] != ENCODING_MAGIC:
+            raise ValueError("not an encoded Catan game, or one from before roads had places")
+        hex_count, player_count, current, turns, width, holder = struct.unpack_from('<HBBIHB', data, 4)
+        offset = 15
+        layout = []
+        for _ in range(hex_count):
+            code, number, owner_count = struct.unpack_from('<BBB', data, offset)
+            offset += 3
+            layout.append((BOARD_RESOURCES[code], number, data[offset:offset + owner_count]))
+            offset += owner_count
+        players = []
+        for _ in range(player_count):
+            name_len, personality_len = struct.unpack_from('<BB', data, offset)
+            offset += 2
+            name = data[offset:offset + name_len].decode()
+            offset += name_len
+            personality = data[offset:offset + personality_len].decode() or None
+            offset += personality_len
+            is_human, vp, *rest = struct.unpack_from('<?B5HHHH', data, offset)
+            offset += struct.calcsize('<?B5HHHH')
+            counts, (settlement_count, city_count, road_count) = rest[:5], rest[5:]
+            player = Player(name, is_human=is_human, personality=personality)
+            player.counts = array('i', counts)
+            player.victory_points = vp
+            player.settlements = array('H', struct.unpack_from(f'<{settlement_count}H', data, offset))
+            offset += 2 * settlement_count
+            player.cities = array('H', struct.unpack_from(f'<{city_count}H', data, offset))
+            offset += 2 * city_count
+            ends = struct.unpack_from(f'<{2 * road_count}H', data, offset)
+            offset += 4 * road_count
+            player.roads = list(zip(ends[::2], ends[1::2]))
+            players.append(player)
+
+        return cls.assemble(players, layout, width, current, turns, holder if holder != NO_SEAT else None, seed, sinks)
+
+    @classmethod
+    def assemble(cls, players, layout, width, current, turns, holder=None, seed=None, sinks=None):
+        # A game from its parts: the players with their holdings, and the board as
+        # (resource, number, owner seats) per hex. Used by decode and by anything else
+        # that keeps positions in its own format.
+        game = cls.__new__(cls)
+        game.seed = seed
+        game.rng = random.Random(seed)
+        game.dice = DiceStream(random.Random(derive_seed(seed, 'dice')))
+        game.console = False
+        game.ask = input
+        game.players = players
+        game.board = [{'resource': r, 'number': n, 'owner': [players[i] for i in seats]} for r, n, seats in layout]
+        game.board_width = width
+        game.adjacency_offsets, game.adjacency = hex_adjacency(len(layout), width)
+        # Replayed order of first settlement is lost; board order will do
+        game.owned_hexes = [h for h, hex_ in enumerate(game.board) if hex_['owner']]
+        game.board_rows = {}
+        game.production = {}
+        for hex_number in game.owned_hexes:
+            game.update_production(hex_number)
+        game.score_hexes()
+        game.rebuild_roads(players[holder] if holder is not None else None)
+        game.turn_order = players[:]
+        game.current_player_index = current
+        game.total_players = len(players)
+        game.turns_played = turns
+        game.vp_history = []
+        game.winner = next((p for p in players if p.victory_points >= 10), None)
+        game.searchers = {}
+        game.setup_searchers()
+        game.events = EventBus(sinks or ())
+        game.events.attach(game)
+        return game
+
+    def end_turn(self, player):
+        self.turns_played += 1
+        if player.victory_points >= 10:
+            self.winner = player
+        self.current_player_index = (self.current_player_index + 1) % self.total_players
+
+    def rollout(self, max_turns):
+        # Fast stepping for search: no events, no VP history, no human prompts.
+        # Only the player whose turn it is can gain VP, so only they are checked.
+        for _ in range(max_turns):
+            if self.winner is not None:
+                break
+            player = self.turn_order[self.current_player_index]
+            self.distribute_resources(self.roll_dice())
+            self.ai_action(player)
+            self.end_turn(player)
+        return self.winner
 
     def next_player(self):
         self.current_player_index = (self.current_player_index + 1) % self.total_players
@@ -633,41 +1786,78 @@ class Game:
     def is_game_over(self):
         for player in self.players:
             if player.victory_points >= 10:
-                print(f"\nGame Over! {player.name} wins!")
+                self.winner = player
+                self.emit(GAME_OVER, player)
                 return True
         return False
 
-    def play(self):
-        print("Welcome to Catan!")
-        print("\n--- Purpose of the Game ---")
-        print("Earn 10 Victory Points (VP) by building settlements, roads, and cities.")
-
-        print("\n--- How the Game Works ---")
-        print("1. The board is composed of hexes, each producing a specific resource (brick, lumber, ore, grain, wool) or desert.")
-        print("   Each hex has a number (2-12). At the start of a turn, you roll two dice. The sum determines which hexes produce resources.")
-        print("2. Settlements adjacent to a producing hex earn 1 resource; cities earn 2 of that resource. Desert hexes never produce.")
-        print("3. If a 7 is rolled, no one collects resources and the robber would be activated (not fully implemented here).")
-        print("4. Your goal is to reach 10 VP. Settlements grant 1 VP, cities grant an additional VP over a settlement, reaching 2 total.")
-        print("5. On your turn, you can:")
-        print("   - Build: Use resources to construct a settlement, road, or upgrade a settlement to a city.")
-        print("   - Trade: Offer your resources and request others. AI players consider fairness, scarcity, and personal benefit. You can accept, reject, or counter trades offered to you.")
-        print("   - Pass: If you pass without having built or traded, you gain 1 random resource as a bonus.")
-        print("6. The game features AI players with different personalities (generous, fair, greedy) who evaluate trades differently.")
-        print("7. Once you or another player reaches 10 VP, the game ends immediately and that player wins.")
-        print("8. After the last player in a round finishes their turn, press Enter to continue and start the next round.")
-        print("\nStarting the game!")
+    def play(self, max_turns=None):
+        return self.run_steps(self.play_steps(max_turns))
+
+    def play_steps(self, max_turns=None):
+        # Stopping at max_turns leaves the game open, so play() can carry on from there
+        if self.events.active and self.turns_played == 0:
+            self.show_intro()
 
         while not self.is_game_over():
-            self.take_turn()
+            if max_turns is not None and self.turns_played >= max_turns:
+                break
+            yield from self.turn_steps()
+            self.turns_played += 1
+            self.vp_history.append(tuple(p.victory_points for p in self.players))
             if self.current_player_index == self.total_players - 1:
                 self.next_player()
-                input("\nEnd of round. Press Enter to continue to the next round...")
-                os.system('clear')
+                if any(p.is_human for p in self.players):
+                    yield "\nEnd of round. Press Enter to continue to the next round..."
+                    if self.console:
+                        clear_screen()
             else:
                 self.next_player()
+        else:
+            self.close()
+
+        winner_seat = self.players.index(self.winner) if self.winner else None
+        return GameResult(self.winner, self.turns_played, self.vp_history, self.seed, winner_seat)
+
+    def close(self):
+        # Closes the sinks; play() does this once the game is won, and a game given up
+        # before then is closed by whoever stopped it
+        self.events.close()
+
+    def show_intro(self):
+        self.say("Welcome to Catan!")
+        self.say("\n--- Purpose of the Game ---")
+        self.say("Earn 10 Victory Points (VP) by building settlements, roads, and cities.")
+
+        self.say("\n--- How the Game Works ---")
+        self.say("1. The board is composed of hexes, each producing a specific resource (brick, lumber, ore, grain, wool) or desert.")
+        self.say("   Each hex has a number (2-12). At the start of a turn, you roll two dice. The sum determines which hexes produce resources.")
+        self.say("2. Settlements adjacent to a producing hex earn 1 resource; cities earn 2 of that resource. Desert hexes never produce.")
+        self.say("3. If a 7 is rolled, no one collects resources and the robber would be activated (not fully implemented here).")
+        self.say("4. Your goal is to reach 10 VP. Settlements grant 1 VP, cities grant an additional VP over a settlement, reaching 2 total.")
+        self.say("5. On your turn, you can:")
+        self.say("   - Build: Use resources to construct a settlement, road, or upgrade a settlement to a city.")
+        self.say("   - Trade: Offer your resources and request others. AI players consider fairness, scarcity, and personal benefit. You can accept, reject, or counter trades offered to you.")
+        self.say("   - Pass: If you pass without having built or traded, you gain 1 random resource as a bonus.")
+        self.say("6. The game features AI players with different personalities (generous, fair, greedy) who evaluate trades differently.")
+        self.say("7. Once you or another player reaches 10 VP, the game ends immediately and that player wins.")
+        self.say("8. After the last player in a round finishes their turn, press Enter to continue and start the next round.")
+        self.say("\nStarting the game!")
+
+
+def clear_screen():
+    # ANSI escape instead of running `clear` in a subshell
+    if sys.stdout.isatty():
+        sys.stdout.write("\033[H\033[2J")
+        sys.stdout.flush()
+
+
+def simulate(seed=None, personalities=("generous", "greedy", "fair"), max_turns=None, board_size=STANDARD_BOARD_SIZE):
+    return Game(seed=seed, personalities=personalities, headless=True, board_size=board_size).play(max_turns=max_turns)
 
 
 if __name__ == "__main__":
+    clear_screen()
     human_name = input("Enter your name: ").strip()
     game = Game(human_name)
     game.play()
@@ -0,0 +1,366 @@
+#!/usr/bin/python3.11
+# Benchmarks for catan.py.
+#
+# Micro benchmarks time the engine's hot paths on positions taken from seeded
+# all-AI games; macro benchmarks time whole games. Every benchmark uses fixed
+# seeds, so two runs do the same work and only the timings differ. Results can
+# be written to a JSON file and compared against a stored baseline.
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import catan
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Runs in a fresh interpreter, so every measurement is a cold import of catan
+IMPORT_SNIPPET = (
+    "import sys, time\n"
+    "start = time.perf_counter()\n"
+    "import catan\n"
+    "elapsed = time.perf_counter() - start\n"
+    "print(elapsed, 'prettytable' in sys.modules)\n"
+)
+
+PERSONALITIES = ("generous", "greedy", "fair")
+# Trades the micro benchmarks cycle through: every one-for-one swap plus a few uneven ones
+TRADES = [({give: 1}, {want: 1}) for give in catan.RESOURCES for want in catan.RESOURCES if give != want]
+TRADES += [({'ore': 2}, {'grain': 1}), ({'wool': 1}, {'brick': 2}), ({'lumber': 1, 'wool': 1}, {'ore': 1})]
+# Seeded games that once hung in the Longest Road search, on dense road networks
+ROAD_GAMES = ((32, ("fair",)), (88, ("fair", "fair")))
+# Plays one of them in a fresh interpreter, so a hung game can be timed out
+ROAD_GAME_SNIPPET = (
+    "import sys, catan\n"
+    "seed, personalities = int(sys.argv[1]), tuple(sys.argv[2:])\n"
+    "print(catan.Game(seed=seed, personalities=personalities, headless=True).play().turns)\n"
+)
+
+
+def bench_import(runs=20):
+    times = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=HERE, capture_output=True, text=True, check=True)
+        elapsed, loaded_prettytable = out.stdout.split()
+        if loaded_prettytable == "True":
+            raise RuntimeError("importing catan loaded prettytable")
+        times.append(float(elapsed))
+    return {
+        'runs': runs,
+        'mean_ms': statistics.mean(times) * 1000,
+        'median_ms': statistics.median(times) * 1000,
+        'min_ms': min(times) * 1000,
+    }
+
+
+def positions(count, turns=60, seed=0):
+    # Mid-game positions: seeded all-AI games stopped after `turns` turns
+    games = []
+    for i in range(count):
+        game = catan.Game(seed=seed + i, headless=True)
+        game.play(max_turns=turns)
+        games.append(game)
+    return games
+
+
+def measure(run, calls, repeat, setup=None):
+    # run(state) makes `calls` calls; setup() builds its state outside the timing.
+    # The best run is the figure that is compared, the median shows the noise.
+    samples = []
+    for _ in range(repeat):
+        state = setup() if setup is not None else None
+        start = time.perf_counter_ns()
+        run(state)
+        samples.append((time.perf_counter_ns() - start) / calls)
+    return {'value': min(samples), 'median': statistics.median(samples), 'unit': 'ns/call', 'higher_is_better': False}
+
+
+def bench_roll_dice(scale):
+    game = catan.Game(seed=0, headless=True)
+    calls = 20000 * scale
+
+    def run(_):
+        roll = game.roll_dice
+        for _ in range(calls):
+            roll()
+    return measure(run, calls, 5)
+
+
+def bench_distribute_resources(scale):
+    # Every dice total in turn on a set of mid-game boards
+    games = positions(20)
+    rolls = list(range(2, 13))
+    rounds = 50 * scale
+    calls = rounds * len(games) * len(rolls)
+
+    def run(_):
+        for _ in range(rounds):
+            for game in games:
+                for roll in rolls:
+                    game.distribute_resources(roll)
+    return measure(run, calls, 5)
+
+
+def bench_can_build(scale):
+    players = [p for game in positions(20) for p in game.players]
+    vectors = (catan.SETTLEMENT_VECTOR, catan.CITY_VECTOR, catan.ROAD_VECTOR)
+    rounds = 200 * scale
+    calls = rounds * len(players) * len(vectors)
+
+    def run(_):
+        for _ in range(rounds):
+            for player in players:
+                for vector in vectors:
+                    player.can_build(vector)
+    return measure(run, calls, 5)
+
+
+def bench_spend_resources(scale):
+    # Each player is copied fresh for every timed run, so whether a spend succeeds
+    # follows the recorded positions rather than earlier runs
+    originals = [p for game in positions(20) for p in game.players]
+    vectors = (catan.SETTLEMENT_VECTOR, catan.CITY_VECTOR, catan.ROAD_VECTOR)
+    copies = 100 * scale
+    calls = copies * len(originals) * len(vectors)
+
+    def setup():
+        return [p.copy() for _ in range(copies) for p in originals]
+
+    def run(players):
+        for player in players:
+            for vector in vectors:
+                player.spend_resources(vector)
+    return measure(run, calls, 5, setup)
+
+
+def bench_evaluate_trade(personality, scale):
+    # evaluate_trade_ai as the engine calls it, with the decision cache warm
+    players = []
+    for game in positions(10):
+        for p in game.players:
+            player = p.copy()
+            player.personality = personality
+            players.append(player)
+    game = catan.Game(seed=0, headless=True)
+    rounds = 20 * scale
+    calls = rounds * len(players) * len(TRADES)
+
+    def run(_):
+        rng = game.rng
+        for _ in range(rounds):
+            for player in players:
+                for offer, request in TRADES:
+                    player.evaluate_trade_ai(offer, request, rng=rng)
+    return measure(run, calls, 5)
+
+
+def bench_decide_trade(personality, scale):
+    # The uncached decision behind evaluate_trade_ai
+    hands = [tuple(p.counts) for game in positions(10) for p in game.players]
+    rounds = 10 * scale
+    calls = rounds * len(hands) * len(TRADES)
+    decide = catan.decide_trade
+
+    def run(_):
+        for _ in range(rounds):
+            for counts in hands:
+                for offer, request in TRADES:
+                    decide(personality, counts, offer, request)
+    return measure(run, calls, 5)
+
+
+def bench_ai_trade(scale):
+    # One AI-initiated trade per fresh copy of a mid-game position
+    games = positions(20)
+    swaps = TRADES[:20]
+    copies = 5 * scale
+    calls = copies * len(games) * len(swaps)
+
+    def setup():
+        return [(game.clone(), offer, request) for _ in range(copies) for game in games for offer, request in swaps]
+
+    def run(trades):
+        for game, offer, request in trades:
+            game.trade_resources(game.turn_order[game.current_player_index], offer, request)
+    return measure(run, calls, 5, setup)
+
+
+def bench_trade_search(scale):
+    # The AI's choice of trade to offer, for every seat of a set of mid-game positions
+    games = positions(20)
+    seats = [(game, player) for game in games for player in game.players]
+    rounds = 100 * scale
+    calls = rounds * len(seats)
+
+    def run(_):
+        for _ in range(rounds):
+            for game, player in seats:
+                game.best_trade_offer(player)
+    return measure(run, calls, 5)
+
+
+def bench_games(scale, personalities=PERSONALITIES, search_iterations=None, games=100, max_turns=2000,
+                board_size=catan.STANDARD_BOARD_SIZE):
+    # Whole seeded headless games; reports games and turns per second
+    count = max(1, games * scale)
+    samples = []
+    turns = 0
+    for _ in range(3):
+        start = time.perf_counter()
+        turns = 0
+        for seed in range(count):
+            game = catan.Game(seed=seed, personalities=personalities, headless=True, search_iterations=search_iterations,
+                              board_size=board_size)
+            turns += game.play(max_turns=max_turns).turns
+        samples.append(time.perf_counter() - start)
+    best = min(samples)
+    return {
+        'value': count / best,
+        'median': count / statistics.median(samples),
+        'unit': 'games/s',
+        'higher_is_better': True,
+        'turns_per_s': turns / best,
+    }
+
+
+def micro_benchmarks():
+    benches = {
+        'roll_dice': bench_roll_dice,
+        'distribute_resources': bench_distribute_resources,
+        'can_build': bench_can_build,
+        'spend_resources': bench_spend_resources,
+        'ai_trade_resources': bench_ai_trade,
+        'best_trade_offer': bench_trade_search,
+    }
+    for personality in PERSONALITIES:
+        benches[f'evaluate_trade_ai.{personality}'] = lambda scale, p=personality: bench_evaluate_trade(p, scale)
+        benches[f'decide_trade.{personality}'] = lambda scale, p=personality: bench_decide_trade(p, scale)
+    return benches
+
+
+def macro_benchmarks():
+    return {
+        'games.all_ai': lambda scale: bench_games(scale),
+        'games.mcts': lambda scale: bench_games(scale, ("mcts", "greedy", "fair"), search_iterations=20, games=2),
+        'games.large_board': lambda scale: bench_games(scale, PERSONALITIES * 3, games=10, board_size=2000),
+    }
+
+
+def run_suite(groups=("micro", "macro"), scale=1, only=None, import_runs=0):
+    benches = {}
+    if "micro" in groups:
+        benches.update(micro_benchmarks())
+    if "macro" in groups:
+        benches.update(macro_benchmarks())
+    results = {}
+    for name, bench in benches.items():
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        results[name] = bench(scale)
+    if import_runs:
+        timing = bench_import(import_runs)
+        results['import'] = {'value': timing['min_ms'], 'median': timing['median_ms'], 'unit': 'ms', 'higher_is_better': False}
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'commit': git_commit(),
+        'time': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'results': results,
+    }
+
+
+def check_road_games(time_limit=10.0):
+    # Plays ROAD_GAMES, each in its own interpreter; returns the ones that did not
+    # finish within `time_limit` seconds
+    failures = []
+    for seed, personalities in ROAD_GAMES:
+        try:
+            subprocess.run([sys.executable, "-c", ROAD_GAME_SNIPPET, str(seed), *personalities], cwd=HERE,
+                           capture_output=True, text=True, check=True, timeout=time_limit)
+        except subprocess.TimeoutExpired:
+            failures.append((seed, personalities))
+    return failures
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True)
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+
+def compare(report, baseline, threshold=0.10):
+    # Relative change of each benchmark against the baseline; a change of more than
+    # `threshold` in the wrong direction is a regression
+    rows = []
+    for name, row in report['results'].items():
+        base = baseline['results'].get(name)
+        if base is None or not base['value']:
+            continue
+        change = (row['value'] - base['value']) / base['value']
+        worse = -change if row['higher_is_better'] else change
+        rows.append({
+            'name': name,
+            'baseline': base['value'],
+            'value': row['value'],
+            'unit': row['unit'],
+            'change': change,
+            'regression': worse > threshold,
+        })
+    return rows
+
+
+def print_report(report):
+    for name, row in report['results'].items():
+        extra = f"  ({row['turns_per_s']:.0f} turns/s)" if 'turns_per_s' in row else ""
+        print(f"{name:<30} {row['value']:>12.1f} {row['unit']:<8} median {row['median']:>12.1f}{extra}")
+
+
+def print_comparison(rows, threshold):
+    for row in rows:
+        flag = "  REGRESSION" if row['regression'] else ""
+        print(f"{row['name']:<30} {row['baseline']:>12.1f} -> {row['value']:>12.1f} {row['unit']:<8} {row['change']:+7.1%}{flag}")
+    regressions = sum(row['regression'] for row in rows)
+    print(f"\n{regressions} regression(s) beyond {threshold:.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark catan.py.")
+    parser.add_argument("--groups", nargs="+", choices=("micro", "macro"), default=["micro", "macro"])
+    parser.add_argument("--only", nargs="+", help="run only benchmarks whose name starts with one of these")
+    parser.add_argument("--scale", type=int, default=1, help="multiply the work done by each benchmark")
+    parser.add_argument("--import-runs", type=int, default=20, help="cold imports to time (0 to skip)")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare against a results file from an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative slowdown reported as a regression")
+    parser.add_argument("--check-roads", action="store_true",
+                        help="only play the games that once hung in the Longest Road search, failing on a timeout")
+    parser.add_argument("--time-limit", type=float, default=10.0, help="seconds each of those games may take")
+    args = parser.parse_args()
+
+    if args.check_roads:
+        failures = check_road_games(args.time_limit)
+        for seed, personalities in failures:
+            print(f"seed {seed} {personalities}: not finished within {args.time_limit:g}s")
+        print(f"{len(ROAD_GAMES) - len(failures)} of {len(ROAD_GAMES)} games finished in time")
+        sys.exit(1 if failures else 0)
+
+    report = run_suite(tuple(args.groups), args.scale, args.only, args.import_runs)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print()
+        rows = compare(report, baseline, args.threshold)
+        print_comparison(rows, args.threshold)
+        if any(row['regression'] for row in rows):
+            sys.exit(1)
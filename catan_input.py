@@ -0,0 +1,208 @@
+#!/usr/bin/python3.11
+# Input providers for the human seat of catan.py games, for unattended runs.
+#
+# A game asks every human prompt through its `ask` callable (input() by
+# default). ScriptedInput answers from a list, FuzzInput answers at random,
+# mostly with well-formed answers and sometimes with junk. fuzz_games plays
+# many games with a fuzzed human seat at full speed, checking after every
+# action that no resources appear, vanish or go negative, and saves the
+# answers of any failing game so it can be replayed with ScriptedInput.
+
+import argparse
+import json
+import random
+import time
+
+import catan
+
+# Resources taken away by each kind of build
+BUILD_COSTS = {
+    'settlement': sum(catan.SETTLEMENT_COST.values()),
+    'city': sum(catan.CITY_COST.values()),
+    'road': sum(catan.ROAD_COST.values()),
+}
+# Malformed answers the fuzzer mixes in
+JUNK = ("", " ", "x", "0", "-1", "-3", "1.5", "99999", "ore ore", "yes", "\t", "12abc")
+
+
+class ScriptedInput:
+    # Answers prompts from a list, in order. Once the list runs out, `default`
+    # answers instead (a callable taking the prompt); with no default that is an
+    # error, so a script that falls out of step with the game is noticed.
+    def __init__(self, answers, default=None):
+        self.answers = list(answers)
+        self.position = 0
+        self.default = default
+        self.transcript = []
+
+    def __call__(self, prompt):
+        if self.position < len(self.answers):
+            answer = self.answers[self.position]
+            self.position += 1
+        elif self.default is not None:
+            answer = self.default(prompt)
+        else:
+            raise RuntimeError(f"script ran out of answers at prompt {prompt!r}")
+        self.transcript.append((prompt, answer))
+        return answer
+
+
+class FuzzInput:
+    # Random answers to every human prompt; `junk` is the chance of a malformed one
+    def __init__(self, seed=None, junk=0.1, hexes=catan.STANDARD_BOARD_SIZE, name="Fuzz"):
+        self.rng = random.Random(seed)
+        self.junk = junk
+        self.hexes = hexes
+        self.name = name
+        self.transcript = []
+
+    def __call__(self, prompt):
+        answer = self.answer(prompt)
+        self.transcript.append((prompt, answer))
+        return answer
+
+    def answer(self, prompt):
+        rng = self.rng
+        if prompt.startswith("Enter your name"):
+            return self.name
+        if prompt.startswith("\nEnd of round"):
+            return ""
+        if rng.random() < self.junk:
+            return rng.choice(JUNK)
+        if prompt.startswith("Choose an action"):
+            return rng.choice("1112233")
+        if prompt.startswith("What do you want to build"):
+            return rng.choice("123")
+        if prompt.startswith("Enter hex number") or prompt.startswith("Enter the"):
+            return str(rng.randint(1, self.hexes))
+        if prompt.startswith("Which resource"):
+            return rng.choice(catan.RESOURCES)
+        if prompt.startswith("How many"):
+            return str(rng.randint(1, 3))
+        if prompt.startswith("Do you accept this trade"):
+            return rng.choice("ync")
+        if prompt.startswith("Accept counter"):
+            return rng.choice("yn")
+        return rng.choice(JUNK)
+
+
+class ConservationCheck(catan.Sink):
+    # Raises RuntimeError as soon as the resources in play differ from what
+    # production, bonuses and building account for, a count goes negative, or a
+    # player's victory points do not match their buildings
+    def attach(self, game):
+        self.game = game
+        self.expected = sum(sum(p.counts) for p in game.players)
+        self.checks = 0
+
+    def handle(self, event):
+        kind = event.kind
+        if kind == catan.PRODUCE:
+            self.expected += event.data['amount']
+        elif kind == catan.BONUS:
+            self.expected += 1
+        elif kind == catan.BUILD:
+            self.expected -= BUILD_COSTS[event.data['item']]
+        elif kind in (catan.STATE, catan.TURN, catan.GAME_OVER):
+            self.check(event)
+
+    def check(self, event):
+        self.checks += 1
+        game = self.game
+        total = 0
+        for player in game.players:
+            if min(player.counts) < 0:
+                raise RuntimeError(f"turn {event.turn}: {player.name} has negative resources {player.resources}")
+            total += sum(player.counts)
+            points = len(player.settlements) + 2 * len(player.cities)
+            if player is game.longest_road_holder:
+                points += 2
+            if player.victory_points != points:
+                raise RuntimeError(f"turn {event.turn}: {player.name} has {player.victory_points} VP for buildings worth {points}")
+        if total != self.expected:
+            raise RuntimeError(f"turn {event.turn}: {total} resources in play, expected {self.expected}")
+
+
+def fuzz_game(seed, game_seed=None, junk=0.1, max_turns=500, personalities=("generous", "greedy", "fair"),
+              board_size=catan.STANDARD_BOARD_SIZE):
+    # One game with a fuzzed human seat; returns (result, answers, error)
+    fuzz = FuzzInput(seed, junk, board_size)
+    check = ConservationCheck()
+    game = catan.Game("Fuzz", seed=game_seed, personalities=personalities, sinks=[check], ask=fuzz,
+                      board_size=board_size)
+    try:
+        result = game.play(max_turns=max_turns)
+    except Exception as error:
+        return None, fuzz.transcript, f"{type(error).__name__}: {error}"
+    return result, fuzz.transcript, None
+
+
+def fuzz_games(games=1000, seed=0, junk=0.1, max_turns=500, personalities=("generous", "greedy", "fair"),
+               board_size=catan.STANDARD_BOARD_SIZE):
+    # Plays seeded fuzzed games; failing games are reported with their seeds and answers
+    turns = 0
+    prompts = 0
+    finished = 0
+    failures = []
+    start = time.perf_counter()
+    for n in range(games):
+        fuzz_seed = catan.derive_seed(seed, 'fuzz', n)
+        game_seed = catan.derive_seed(seed, 'game', n)
+        result, transcript, error = fuzz_game(fuzz_seed, game_seed, junk, max_turns, personalities, board_size)
+        prompts += len(transcript)
+        if error is not None:
+            failures.append({
+                'game': n,
+                'seed': game_seed,
+                'personalities': list(personalities),
+                'board_size': board_size,
+                'error': error,
+                'answers': [answer for _, answer in transcript],
+            })
+            continue
+        turns += result.turns
+        finished += result.winner is not None
+    return {
+        'games': games,
+        'finished': finished,
+        'turns': turns,
+        'prompts': prompts,
+        'seconds': time.perf_counter() - start,
+        'failures': failures,
+    }
+
+
+def replay_failure(failure, max_turns=500):
+    # Plays a saved failing game again with its recorded answers; the error it raises
+    # is the one that was reported
+    game = catan.Game("Fuzz", seed=failure['seed'], personalities=tuple(failure['personalities']),
+                      sinks=[ConservationCheck(), catan.TerminalSink()], ask=ScriptedInput(failure['answers']),
+                      board_size=failure['board_size'])
+    return game.play(max_turns=max_turns)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play Catan games with a fuzzed human seat, unattended.")
+    parser.add_argument("-n", "--games", type=int, default=1000)
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("--junk", type=float, default=0.1, help="chance of a malformed answer")
+    parser.add_argument("--max-turns", type=int, default=500)
+    parser.add_argument("--board-size", type=int, default=catan.STANDARD_BOARD_SIZE)
+    parser.add_argument("-o", "--output", help="write failing games to this JSON file")
+    parser.add_argument("--replay", metavar="FAILURES", help="replay the first failing game saved in this file")
+    args = parser.parse_args()
+
+    if args.replay:
+        with open(args.replay) as f:
+            replay_failure(json.load(f)[0], args.max_turns)
+    else:
+        report = fuzz_games(args.games, args.seed, args.junk, args.max_turns, board_size=args.board_size)
+        print(f"{report['games']} games, {report['finished']} finished, {report['turns']} turns, "
+              f"{report['prompts']} answers in {report['seconds']:.2f}s "
+              f"({report['turns'] / report['seconds']:.0f} turns/s)")
+        for failure in report['failures'][:10]:
+            print(f"  game {failure['game']} (seed {failure['seed']}): {failure['error']}")
+        print(f"{len(report['failures'])} failing games")
+        if args.output and report['failures']:
+            with open(args.output, 'w') as f:
+                json.dump(report['failures'], f)
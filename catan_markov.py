@@ -0,0 +1,394 @@
+#!/usr/bin/python3.11
+# Distribution of the turns an AI player needs to reach 10 VP on a board,
+# computed from a Markov chain over the dice instead of sampled games.
+#
+# The player is modelled alone on the board, building with Game.ai_build and
+# taking the pass bonus whenever it cannot build (what the engine does when no
+# trade partner accepts). Between two of its turns it collects from one roll per
+# seat. A position is what the player has built plus its resource counts, and
+# the chance of every position after each turn follows from the last turn's.
+#
+# Positions are canonicalized so there are few of them:
+#   - settlements always go on the best hexes still free and cities on the best
+#     settlements, so how many of each there are says where they are. Roads are
+#     summed up by how many there are, the longest trail up to LONGEST_ROAD_MIN
+#     and whether another road fits; the first layout found stands for all that
+#     agree on those (on the seed-0 board this moves the mean by under 0.1 turn
+#     against keeping every layout);
+#   - resource counts are capped (a hand of 9 ore plays like a hand of 5 ore
+#     until it is spent down that far). Ore and grain, which cities take several
+#     of, get higher caps than the rest. Capping throws resources away, so the
+#     modelled player is a little slower: on the seed-0 board it gives 62.7
+#     own turns where the engine averages 61.1, and raising the caps closes the
+#     gap at a cost in time (--caps).
+# Structures with the same settlements and cities collect the same resources, so
+# the hands of all of them are one dense NumPy array and a turn is a few
+# vectorized moves per group. The index maps behind those moves are memoized in
+# a bounded LRU cache. Positions less likely than `epsilon` are dropped after
+# every turn; the dropped probability bounds the error.
+
+import argparse
+import math
+import time
+from collections import defaultdict
+
+import numpy as np
+
+import catan
+
+WIN_POINTS = 10
+SETTLEMENT = np.array([catan.SETTLEMENT_COST.get(r, 0) for r in catan.RESOURCES])
+CITY = np.array([catan.CITY_COST.get(r, 0) for r in catan.RESOURCES])
+ROAD = np.array([catan.ROAD_COST.get(r, 0) for r in catan.RESOURCES])
+# What ai_build tries, in order
+BUILDS = (('settlement', SETTLEMENT), ('city', CITY), ('road', ROAD))
+# Resource caps, in catan.RESOURCES order
+DEFAULT_CAPS = (2, 2, 5, 5, 3)
+
+
+def solo_game(game):
+    # A one-player game on a copy of the game's board with nothing built, for the
+    # engine's placement code to lay out the structures
+    probe = catan.Game(seed=0, personalities=("fair",), headless=True, board_size=len(game.board),
+                       board_width=game.board_width)
+    probe.board = [{'resource': h['resource'], 'number': h['number'], 'owner': []} for h in game.board]
+    probe.score_hexes()
+    player = probe.players[0]
+    for i in range(len(catan.RESOURCES)):
+        player.counts[i] = 0
+    return probe
+
+
+class Structure:
+    # What the player has built, with the structures each kind of build leads to
+    def __init__(self, game):
+        self.game = game
+        player = game.players[0]
+        self.won = player.victory_points >= WIN_POINTS
+        self.road_edge = game.best_road_edge(player)
+        self.buildings = (len(player.settlements), len(player.cities))
+        longest = min(game.longest_roads[player], catan.LONGEST_ROAD_MIN)
+        self.key = self.buildings + (len(player.roads), longest, self.road_edge is None)
+        # Which row of the action codes applies: whether a city and a road can be built
+        self.kind = 2 * (len(player.settlements) > 0) + (self.road_edge is not None)
+        self.children = {}
+        self.group = None
+        self.row = None
+
+
+class Group:
+    # The structures with the same settlements and cities, as rows of one array of hands
+    def __init__(self, game):
+        self.structures = []
+        self.kinds = np.zeros(0, dtype=np.intp)
+        # build -> (group the children are in, child row of each row or -1 for a win)
+        self.destinations = {}
+        # rolls between two turns -> (targets, odds), see TurnModel.roll_map
+        self.roll = {}
+        self.production = {}
+        for number, producing in game.production.items():
+            income = [0] * len(catan.RESOURCES)
+            for entries in producing.values():
+                for _, resource, amount in entries:
+                    income[catan.RESOURCE_INDEX[resource]] += amount
+            if any(income) and number != 7:
+                self.production[number] = tuple(income)
+
+    def add(self, node):
+        node.group = self
+        node.row = len(self.structures)
+        self.structures.append(node)
+        self.kinds = np.append(self.kinds, node.kind)
+
+
+class TurnModel:
+    def __init__(self, game, players=3, seat=0, cap=DEFAULT_CAPS, epsilon=1e-10, cache_size=256):
+        self.players = players
+        self.seat = seat
+        # One cap for every resource, or one per resource
+        self.caps = np.array(cap if isinstance(cap, (tuple, list)) else [cap] * len(catan.RESOURCES))
+        self.epsilon = epsilon
+        self.shape = tuple(int(c) + 1 for c in self.caps)
+        self.size = math.prod(self.shape)
+        # counts[:, i]: the resource counts of flat index i
+        self.counts = np.indices(self.shape).reshape(len(catan.RESOURCES), -1)
+        self.strides = np.array([math.prod(self.shape[i + 1:]) for i in range(len(catan.RESOURCES))])
+        # Index maps by income, in a bounded LRU store
+        self.cache = catan.LRUCache(cache_size)
+        # bonus[i]: where each hand goes when the pass bonus is resource i
+        self.bonus = np.stack([self.targets(tuple(np.eye(len(catan.RESOURCES), dtype=int)[i]))
+                               for i in range(len(catan.RESOURCES))])
+        self.codes = self.action_codes()
+        self.structures = {}
+        self.groups = {}
+        self.root = self.structure(solo_game(game))
+
+    def structure(self, game):
+        node = Structure(game)
+        # Different build orders can end in the same structure
+        known = self.structures.get(node.key)
+        if known is not None:
+            return known
+        self.structures[node.key] = node
+        if not node.won:
+            group = self.groups.get(node.buildings)
+            if group is None:
+                group = self.groups[node.buildings] = Group(game)
+            group.add(node)
+        return node
+
+    def child(self, node, build):
+        child = node.children.get(build)
+        if child is None:
+            game = node.game.clone()
+            player = game.players[0]
+            if build == 'settlement':
+                game.place_settlement(player, game.best_settlement_hex(player))
+            elif build == 'city':
+                game.upgrade_to_city(player, game.best_city_hex(player))
+            else:
+                game.build_road(player, node.road_edge)
+            child = node.children[build] = self.structure(game)
+        return child
+
+    def destinations(self, group, build, rows):
+        # The group a build from these rows leads to, and the child row of every row
+        into, to = group.destinations.get(build, (None, np.zeros(0, dtype=np.intp)))
+        if len(to) < len(group.structures):
+            to = np.concatenate([to, np.full(len(group.structures) - len(to), -2, dtype=np.intp)])
+        for row in rows[to[rows] == -2]:
+            child = self.child(group.structures[row], build)
+            if child.won:
+                to[row] = -1
+            else:
+                # Every build of one kind from a group leads to the same group
+                into = child.group
+                to[row] = child.row
+        group.destinations[build] = (into, to)
+        return into, to
+
+    def targets(self, income):
+        # Flat index of every hand after collecting `income`, capped
+        targets = self.cache.get(income)
+        if targets is None:
+            added = np.minimum(self.counts + np.array(income)[:, None], self.caps[:, None])
+            targets = np.ravel_multi_index(added, self.shape)
+            self.cache.put(income, targets)
+        return targets
+
+    def roll_map(self, group, rolls):
+        # Targets of each distinct income over `rolls` dice rolls, and their chances. Capping
+        # once at the end lands where capping after every roll would, so incomes are summed
+        # (capped, as more than a cap adds nothing) and every hand moves once.
+        roll = group.roll.get(rolls)
+        if roll is None:
+            odds = {(0,) * len(catan.RESOURCES): 1.0}
+            for _ in range(rolls):
+                after = {}
+                for total in range(2, 13):
+                    income = group.production.get(total, (0,) * len(catan.RESOURCES))
+                    for before, chance in odds.items():
+                        summed = tuple(min(a + b, int(c)) for a, b, c in zip(before, income, self.caps))
+                        after[summed] = after.get(summed, 0.0) + chance * catan.DICE_ODDS[total]
+                odds = after
+            roll = (np.stack([self.targets(income) for income in odds]), np.array(list(odds.values())))
+            group.roll[rolls] = roll
+        return roll
+
+    def action_codes(self):
+        # codes[kind, hand]: what ai_build does with the hand, an index into BUILDS or
+        # len(BUILDS) to pass, for each Structure.kind
+        counts = self.counts
+        codes = np.full((4, self.size), len(BUILDS), dtype=np.int8)
+        for kind in range(4):
+            settlement = (counts >= SETTLEMENT[:, None]).all(axis=0)
+            city = ~settlement & (counts >= CITY[:, None]).all(axis=0) & bool(kind & 2)
+            road = ~settlement & ~city & (counts >= ROAD[:, None]).all(axis=0) & bool(kind & 1)
+            for code, mask in enumerate((settlement, city, road)):
+                codes[kind, mask] = code
+        return codes
+
+    def start(self):
+        # Starting hands: five resources drawn at random, as distribute_starting_resources deals them
+        hands = np.zeros((1, self.size))
+        draws = 5
+        sides = len(catan.RESOURCES)
+        for hand in compositions(draws, sides):
+            ways = math.factorial(draws)
+            for n in hand:
+                ways //= math.factorial(n)
+            index = np.ravel_multi_index(tuple(np.minimum(hand, self.caps)), self.shape)
+            hands[0, index] += ways / sides ** draws
+        return {self.root.group: hands}
+
+    def turn(self, dist, rolls):
+        # One turn of every position: the rolls since the player's last turn, then
+        # ai_build or the pass bonus. Returns the next distribution and the chance of winning now.
+        size = self.size
+        sides = len(catan.RESOURCES)
+        moves = defaultdict(list)
+        won = 0.0
+        for group, hands in dist.items():
+            targets, odds = self.roll_map(group, rolls)
+            # Only the hands held with some chance are moved
+            rows, cells = np.nonzero(hands)
+            flat = targets[:, cells]
+            flat += rows * size
+            hands = np.bincount(flat.ravel(), weights=np.multiply.outer(odds, hands[rows, cells]).ravel(),
+                                minlength=hands.size).reshape(hands.shape)
+            rows, cells = np.nonzero(hands)
+            held = hands[rows, cells]
+            codes = self.codes[group.kinds[rows], cells]
+            # Which rows hold hands that build, to look up only their destinations
+            present = np.zeros(len(group.structures), dtype=bool)
+            for code, (build, cost) in enumerate(BUILDS):
+                chosen = np.flatnonzero(codes == code)
+                if not len(chosen):
+                    continue
+                from_rows = rows[chosen]
+                present[:] = False
+                present[from_rows] = True
+                into, to = self.destinations(group, build, np.flatnonzero(present))
+                to = to[from_rows]
+                moved = held[chosen]
+                won += moved[to < 0].sum()
+                stay = to >= 0
+                if stay.any():
+                    # Spending never hits a cap, so each hand moves to its own cell
+                    flat = to[stay] * size
+                    flat += cells[chosen[stay]] - cost @ self.strides
+                    moves[into].append((flat, moved[stay]))
+            passing = np.flatnonzero(codes == len(BUILDS))
+            if len(passing):
+                flat = self.bonus[:, cells[passing]]
+                flat += rows[passing] * size
+                moves[group].append((flat.ravel(), np.tile(held[passing] / sides, sides)))
+        after = {}
+        for group, parts in moves.items():
+            index = np.concatenate([index for index, _ in parts])
+            weights = np.concatenate([weights for _, weights in parts])
+            after[group] = np.bincount(index, weights=weights, minlength=len(group.structures) * size).reshape(-1, size)
+        return after, won
+
+    def solve(self, max_turns=500, tolerance=1e-9):
+        # Chance of reaching WIN_POINTS on each of the player's own turns
+        start = time.perf_counter()
+        dist = self.start()
+        wins = []
+        pruned = 0.0
+        peak = 0
+        for turn in range(1, max_turns + 1):
+            rolls = self.seat + 1 if turn == 1 else self.players
+            dist, won = self.turn(dist, rolls)
+            wins.append(won)
+            positions = 0
+            for group in list(dist):
+                hands = dist[group]
+                small = hands < self.epsilon
+                pruned += hands[small].sum()
+                hands[small] = 0.0
+                live = np.count_nonzero(hands)
+                if live:
+                    positions += live
+                else:
+                    del dist[group]
+            peak = max(peak, positions)
+            if sum(hands.sum() for hands in dist.values()) < tolerance:
+                break
+        return {
+            'wins': wins,
+            'unresolved': float(sum(hands.sum() for hands in dist.values())),
+            'pruned': float(pruned),
+            'structures': len(self.structures),
+            'peak_positions': peak,
+            'cache': self.cache.info(),
+            'seconds': time.perf_counter() - start,
+        }
+
+    def game_turn(self, own_turn):
+        # The game's turn count (GameResult.turns) when the player wins on that turn of its own
+        return (own_turn - 1) * self.players + self.seat + 1
+
+
+def compositions(total, parts):
+    # Every way of splitting `total` into `parts` ordered counts
+    if parts == 1:
+        yield (total,)
+        return
+    for first in range(total + 1):
+        for rest in compositions(total - first, parts - 1):
+            yield (first,) + rest
+
+
+def summarize(wins, to_turn=lambda turn: turn):
+    # Mean and percentiles of a turn distribution given as chances for turns 1, 2, ...
+    reached = float(sum(wins))
+    mean = float(sum(to_turn(t) * p for t, p in enumerate(wins, start=1)) / reached) if reached else None
+    percentiles = {}
+    seen = 0.0
+    targets = [(0.1, 'p10'), (0.5, 'p50'), (0.9, 'p90'), (0.99, 'p99')]
+    for t, p in enumerate(wins, start=1):
+        seen += p
+        while targets and seen >= targets[0][0] * reached:
+            percentiles[targets.pop(0)[1]] = to_turn(t)
+    return dict({'reached': reached, 'mean': mean}, **percentiles)
+
+
+def sample_turns(game, games=1000, players=3, seat=0, seed=0, max_turns=500):
+    # The same solo player played out by the engine, for checking the model: own turns
+    # to WIN_POINTS in each game, or None when it never got there
+    probe = solo_game(game)
+    turns = []
+    for n in range(games):
+        solo = probe.clone(seed=catan.derive_seed(seed, 'markov', n))
+        solo.distribute_starting_resources()
+        player = solo.players[0]
+        result = None
+        for turn in range(1, max_turns + 1):
+            rolls = seat + 1 if turn == 1 else players
+            for _ in range(rolls - 1):
+                solo.distribute_resources(solo.roll_dice())
+            solo.take_turn()
+            if player.victory_points >= WIN_POINTS:
+                result = turn
+                break
+        turns.append(result)
+    return turns
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Approximate distribution of the turns the AI build policy needs to win on a board, "
+                                                 "from a Markov model with capped resource counts.")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="seed of the board")
+    parser.add_argument("--board-size", type=int, default=catan.STANDARD_BOARD_SIZE)
+    parser.add_argument("--players", type=int, default=3, help="seats, i.e. dice rolls between two of the player's turns")
+    parser.add_argument("--seat", type=int, default=0)
+    parser.add_argument("--caps", type=int, nargs=len(catan.RESOURCES), default=list(DEFAULT_CAPS),
+                        metavar="N", help="most of each resource (brick lumber ore grain wool) a position keeps track of")
+    parser.add_argument("--epsilon", type=float, default=1e-10, help="drop positions less likely than this")
+    parser.add_argument("--cache-size", type=int, default=256, help="index maps kept in the LRU cache")
+    parser.add_argument("--max-turns", type=int, default=500)
+    parser.add_argument("--check", type=int, default=0, metavar="GAMES", help="also play this many engine games to compare")
+    args = parser.parse_args()
+
+    game = catan.Game(seed=args.seed, headless=True, board_size=args.board_size)
+    model = TurnModel(game, args.players, args.seat, tuple(args.caps), args.epsilon, args.cache_size)
+    report = model.solve(args.max_turns)
+    own = summarize(report['wins'])
+    overall = summarize(report['wins'], model.game_turn)
+    print(f"Solved in {report['seconds']:.2f}s: {report['structures']} structures, "
+          f"at most {report['peak_positions']} positions a turn, cache {report['cache']}")
+    print(f"Probability accounted for: {own['reached']:.9f} "
+          f"(pruned {report['pruned']:.2e}, unresolved after {len(report['wins'])} turns {report['unresolved']:.2e})")
+    print(f"Own turns to {WIN_POINTS} VP:  mean {own['mean']:.2f}, p10 {own['p10']}, p50 {own['p50']}, "
+          f"p90 {own['p90']}, p99 {own['p99']}")
+    print(f"Game turns to {WIN_POINTS} VP: mean {overall['mean']:.2f}, p10 {overall['p10']}, p50 {overall['p50']}, "
+          f"p90 {overall['p90']}, p99 {overall['p99']}")
+    if args.check:
+        start = time.perf_counter()
+        samples = sample_turns(game, args.check, args.players, args.seat, args.seed, args.max_turns)
+        reached = [t for t in samples if t is not None]
+        mean = sum(reached) / len(reached)
+        error = math.sqrt(sum((t - mean) ** 2 for t in reached) / (len(reached) - 1) / len(reached))
+        print(f"Engine, {args.check} games in {time.perf_counter() - start:.2f}s: mean own turns {mean:.2f} "
+              f"(standard error {error:.2f}), {len(reached) / len(samples):.1%} reached {WIN_POINTS} VP")
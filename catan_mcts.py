@@ -0,0 +1,229 @@
+#!/usr/bin/python3.11
+# Monte Carlo tree search for the "mcts" AI personality in catan.py.
+#
+# The tree covers the searching player's own turn (trades, then a build or a
+# pass). Each iteration plays a clone of the game through the tree, finishes
+# the turn, runs a short random rollout with the built-in AI for every seat
+# and scores the result from the searching player's point of view.
+
+import math
+import random
+import time
+from collections import OrderedDict
+
+import catan
+
+EXPLORATION = 0.7
+MAX_TRADE_ATTEMPTS = 2
+SETTLEMENT_CANDIDATES = 5
+
+
+class Node:
+    __slots__ = ('moves', 'children', 'visits', 'value')
+
+    def __init__(self):
+        self.moves = None
+        self.children = {}
+        self.visits = 0
+        self.value = 0.0
+
+
+def legal_moves(game, player, attempts, rng):
+    counts = player.counts
+    moves = []
+
+    if player.can_build(catan.SETTLEMENT_VECTOR):
+        # The best few hexes by the board's score table. Hexes with the same resource
+        # and number are worth the same to us, and deserts and 7s never produce.
+        owned = set(player.settlements)
+        owned.update(player.cities)
+        seen = set()
+        for i in game.placement_order:
+            if len(seen) == SETTLEMENT_CANDIDATES or game.hex_scores[i] == 0.0:
+                break
+            key = (game.board[i]['resource'], game.board[i]['number'])
+            if i in owned or key in seen:
+                continue
+            seen.add(key)
+            moves.append(('settlement', i))
+
+    if player.settlements and player.can_build(catan.CITY_VECTOR):
+        seen = set()
+        for i in player.settlements:
+            key = (game.board[i]['resource'], game.board[i]['number'])
+            if key not in seen:
+                seen.add(key)
+                moves.append(('city', i))
+
+    if player.can_build(catan.ROAD_VECTOR):
+        # Only the edge the built-in AI would pick; the tree stays small
+        edge = game.best_road_edge(player)
+        if edge is not None:
+            moves.append(('road', edge))
+
+    if attempts < MAX_TRADE_ATTEMPTS:
+        # One-for-one swaps of a surplus resource for one we are short of
+        surplus = [r for i, r in enumerate(catan.RESOURCES) if counts[i] > catan.BUILD_CAPS[i]]
+        short = [r for i, r in enumerate(catan.RESOURCES) if counts[i] < catan.BUILD_CAPS[i]]
+        for give in surplus:
+            for want in short:
+                moves.append(('trade', give, want))
+
+    rng.shuffle(moves)
+    moves.append(('pass',))
+    return moves
+
+
+def production_rate(game, player):
+    rate = 0.0
+    for number, producing in game.production.items():
+        odds = catan.DICE_ODDS[number] if number != 7 else 0.0
+        for entries in producing.values():
+            for owner, _, amount in entries:
+                if owner is player:
+                    rate += odds * amount
+    return rate
+
+
+def evaluate(game, seat):
+    winner = game.winner
+    me = game.players[seat]
+    if winner is not None:
+        return 1.0 if winner is me else 0.0
+    best_other = max(p.victory_points for p in game.players if p is not me)
+    value = 0.5 + 0.06 * (me.victory_points - best_other) + 0.15 * production_rate(game, me)
+    return min(1.0, max(0.0, value))
+
+
+class MCTS:
+    def __init__(self, budget=0.05, iterations=None, rollout_rounds=3, seed=None, table_size=4096):
+        # budget is wall-clock seconds per decision; a fixed iteration count
+        # makes the search reproducible instead
+        if iterations is not None and iterations < 1:
+            raise ValueError("a search needs at least one iteration")
+        if iterations is None and not budget > 0:
+            raise ValueError("a search budget must be more than 0 seconds")
+        self.budget = budget
+        self.iterations = iterations
+        self.rollout_rounds = rollout_rounds
+        self.rng = random.Random(seed)
+        self.table_size = table_size
+        # Trees keyed by position, so a position reached again (for example
+        # after a trade the search already explored) starts from its old stats
+        self.table = OrderedDict()
+        self.decisions = 0
+        self.total_iterations = 0
+        self.reused = 0
+
+    def state_key(self, game, traded, attempts):
+        owners, players, current, _, holder = game.snapshot()
+        return (owners, players, current, holder, traded, attempts)
+
+    def lookup(self, key):
+        node = self.table.get(key)
+        if node is None:
+            node = self.store(key, Node())
+        else:
+            self.table.move_to_end(key)
+            if node.visits:
+                self.reused += 1
+        return node
+
+    def store(self, key, node):
+        # Adds a node to the table, evicting the least recently used past table_size
+        self.table[key] = node
+        if len(self.table) > self.table_size:
+            self.table.popitem(last=False)
+        return node
+
+    def choose(self, game, player, traded=False, attempts=0):
+        seat = game.players.index(player)
+        root = self.lookup(self.state_key(game, traded, attempts))
+        if root.moves is None:
+            root.moves = legal_moves(game, player, attempts, self.rng)
+        self.decisions += 1
+        if len(root.moves) == 1:
+            return root.moves[0]
+
+        if self.iterations is not None:
+            for _ in range(self.iterations):
+                self.iterate(game, seat, root, traded, attempts)
+        else:
+            # At least one iteration, however little of the budget is left
+            deadline = time.perf_counter() + self.budget
+            while True:
+                self.iterate(game, seat, root, traded, attempts)
+                if time.perf_counter() >= deadline:
+                    break
+
+        return max(root.children.items(), key=lambda item: item[1].visits)[0]
+
+    def iterate(self, game, seat, root, traded, attempts):
+        self.total_iterations += 1
+        sim = game.clone(seed=self.rng.getrandbits(32))
+        for p in sim.players:
+            p.is_human = False
+        me = sim.players[seat]
+
+        node = root
+        path = [root]
+        turn_over = False
+        while True:
+            if node.moves is None:
+                node.moves = legal_moves(sim, me, attempts, self.rng)
+            expanding = len(node.children) < len(node.moves)
+            if expanding:
+                move = node.moves[len(node.children)]
+                child = Node()
+                node.children[move] = child
+            else:
+                move, child = self.select(node)
+            path.append(child)
+
+            if move[0] == 'trade':
+                attempts += 1
+                if sim.play_move(me, move):
+                    traded = True
+                if expanding:
+                    # Register the position after the trade so the real game can
+                    # pick this subtree up if it makes the same trade
+                    key = self.state_key(sim, traded, attempts)
+                    if key not in self.table:
+                        self.store(key, child)
+                    break
+            else:
+                sim.play_move(me, move, traded)
+                turn_over = True
+                break
+            node = child
+
+        if not turn_over:
+            sim.ai_action(me)
+        sim.end_turn(me)
+        sim.rollout(self.rollout_rounds * sim.total_players)
+
+        value = evaluate(sim, seat)
+        for n in path:
+            n.visits += 1
+            n.value += value
+
+    def select(self, node):
+        log_visits = math.log(node.visits) if node.visits else 0.0
+        best = None
+        best_score = -1.0
+        for move, child in node.children.items():
+            if child.visits == 0:
+                return move, child
+            score = child.value / child.visits + EXPLORATION * math.sqrt(log_visits / child.visits)
+            if score > best_score:
+                best_score = score
+                best = (move, child)
+        return best
+
+    def stats(self):
+        return {
+            'decisions': self.decisions,
+            'iterations': self.total_iterations,
+            'reused_roots': self.reused,
+            'table_size': len(self.table),
+        }
@@ -0,0 +1,182 @@
+#!/usr/bin/python3.11
+# Batched NumPy estimates of resource income for a catan.py position.
+# Instead of running take_turn, the board and its owners are turned into a
+# hex x player x resource production matrix and millions of dice rolls are
+# looked up against it at once.
+
+import argparse
+
+import numpy as np
+
+import catan
+
+# Probability of each two-dice total, indexed by the total (0 and 1 are impossible)
+DICE_PROBABILITY = np.array([0, 0, 1, 2, 3, 4, 5, 6, 5, 4, 3, 2, 1], dtype=np.float64) / 36
+
+
+def production_matrix(game):
+    # matrix[h, p, r]: how many of resource r player p collects when hex h produces
+    matrix = np.zeros((len(game.board), len(game.players), len(catan.RESOURCES)), dtype=np.int32)
+    seat = {id(p): i for i, p in enumerate(game.players)}
+    for producing in game.production.values():
+        for hex_number, entries in producing.items():
+            for owner, resource, amount in entries:
+                matrix[hex_number, seat[id(owner)], catan.RESOURCE_INDEX[resource]] += amount
+    return matrix
+
+
+def roll_table(game, matrix=None):
+    # table[roll, p, r]: what player p collects of resource r on that dice total
+    if matrix is None:
+        matrix = production_matrix(game)
+    numbers = np.array([h['number'] for h in game.board], dtype=np.intp)
+    table = np.zeros((13,) + matrix.shape[1:], dtype=np.int32)
+    np.add.at(table, numbers, matrix)
+    table[7] = 0
+    return table
+
+
+def cost_array(cost):
+    # A build cost as a NumPy array in catan.RESOURCES order
+    array = np.zeros(len(catan.RESOURCES), dtype=np.int32)
+    for r, amt in cost.items():
+        array[catan.RESOURCE_INDEX[r]] = amt
+    return array
+
+
+def roll_batch(rng, size):
+    return rng.integers(1, 7, size=size) + rng.integers(1, 7, size=size)
+
+
+def expected_income(game, table=None):
+    # Exact per-roll income from the dice distribution, with the same fields as
+    # simulate_income
+    if table is None:
+        table = roll_table(game)
+    table = table.astype(np.float64)
+    mean = np.tensordot(DICE_PROBABILITY, table, axes=1)
+    second = np.tensordot(DICE_PROBABILITY, table ** 2, axes=1)
+    per_roll = table.sum(axis=2)
+    total_mean = DICE_PROBABILITY @ per_roll
+    return {
+        'mean': mean,
+        'variance': second - mean ** 2,
+        'total_mean': total_mean,
+        'total_variance': DICE_PROBABILITY @ per_roll ** 2 - total_mean ** 2,
+    }
+
+
+def simulate_income(game, rolls=1_000_000, batch_size=250_000, seed=None, table=None):
+    # Monte Carlo per-roll income: mean and variance per player and resource, plus
+    # the variance of each player's total income per roll
+    if table is None:
+        table = roll_table(game)
+    rng = np.random.default_rng(seed)
+    players = table.shape[1]
+    total = np.zeros((players, len(catan.RESOURCES)), dtype=np.float64)
+    total_sq = np.zeros_like(total)
+    sum_total = np.zeros(players, dtype=np.float64)
+    sum_total_sq = np.zeros(players, dtype=np.float64)
+    done = 0
+    while done < rolls:
+        n = min(batch_size, rolls - done)
+        income = table[roll_batch(rng, n)]
+        total += income.sum(axis=0)
+        total_sq += (income.astype(np.int64) ** 2).sum(axis=0)
+        per_roll = income.sum(axis=2, dtype=np.int64)
+        sum_total += per_roll.sum(axis=0)
+        sum_total_sq += (per_roll ** 2).sum(axis=0)
+        done += n
+    mean = total / rolls
+    total_mean = sum_total / rolls
+    return {
+        'mean': mean,
+        'variance': total_sq / rolls - mean ** 2,
+        'total_mean': total_mean,
+        'total_variance': sum_total_sq / rolls - total_mean ** 2,
+    }
+
+
+def time_to_afford(game, cost, trials=100_000, horizon=200, batch_size=5_000, seed=None, table=None):
+    # Rolls until each player can first afford `cost` from their current hand plus
+    # production alone. Trials that never get there within `horizon` rolls are
+    # reported as -1.
+    if table is None:
+        table = roll_table(game)
+    rng = np.random.default_rng(seed)
+    players = table.shape[1]
+    have = np.array([p.counts for p in game.players], dtype=np.int32)
+    need = np.maximum(cost_array(cost)[None, :] - have, 0)
+    result = np.empty((trials, players), dtype=np.int32)
+    done = 0
+    while done < trials:
+        n = min(batch_size, trials - done)
+        rolls = roll_batch(rng, (n, horizon))
+        collected = np.zeros((n, players, len(catan.RESOURCES)), dtype=np.int32)
+        first = np.where((need == 0).all(axis=1), 0, -1)[None, :].repeat(n, axis=0)
+        for t in range(horizon):
+            collected += table[rolls[:, t]]
+            reached = (collected >= need).all(axis=2) & (first < 0)
+            first[reached] = t + 1
+            if (first >= 0).all():
+                break
+        result[done:done + n] = first
+        done += n
+    return result
+
+
+def summarize_times(times):
+    summary = []
+    for column in times.T:
+        reached = column[column >= 0]
+        if reached.size:
+            summary.append({
+                'reached': reached.size / column.size,
+                'mean': float(reached.mean()),
+                'p50': float(np.percentile(reached, 50)),
+                'p90': float(np.percentile(reached, 90)),
+            })
+        else:
+            summary.append({'reached': 0.0, 'mean': None, 'p50': None, 'p90': None})
+    return summary
+
+
+def analyze(game, rolls=1_000_000, trials=100_000, horizon=200, seed=None):
+    table = roll_table(game)
+    return {
+        'income': simulate_income(game, rolls=rolls, seed=seed, table=table),
+        'exact': expected_income(game, table),
+        'settlement': summarize_times(time_to_afford(game, catan.SETTLEMENT_COST, trials, horizon, seed=seed, table=table)),
+        'city': summarize_times(time_to_afford(game, catan.CITY_COST, trials, horizon, seed=seed, table=table)),
+    }
+
+
+def print_analysis(game, report):
+    income = report['income']
+    exact = report['exact']
+    for i, player in enumerate(game.players):
+        per_resource = ', '.join(f"{r}: {income['mean'][i, j]:.3f} ({exact['mean'][i, j]:.3f})"
+                                 for j, r in enumerate(catan.RESOURCES))
+        print(f"\n{player.name} ({player.personality or 'human'})")
+        print(f"  income per roll: {income['total_mean'][i]:.3f} (variance {income['total_variance'][i]:.3f}); "
+              f"exact {exact['total_mean'][i]:.3f} (variance {exact['total_variance'][i]:.3f})")
+        print(f"  by resource, sampled (exact): {per_resource}")
+        for label in ('settlement', 'city'):
+            row = report[label][i]
+            if row['mean'] is None:
+                print(f"  {label}: not affordable within the horizon")
+            else:
+                print(f"  {label}: {row['reached']:.1%} within horizon, mean {row['mean']:.1f} rolls, median {row['p50']:.0f}, p90 {row['p90']:.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estimate resource income for a seeded Catan position.")
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("-t", "--turns", type=int, default=60, help="turns of AI play before analysing the position")
+    parser.add_argument("--rolls", type=int, default=1_000_000)
+    parser.add_argument("--trials", type=int, default=100_000)
+    parser.add_argument("--horizon", type=int, default=200)
+    args = parser.parse_args()
+    game = catan.Game(seed=args.seed, headless=True)
+    game.play(max_turns=args.turns)
+    print_analysis(game, analyze(game, args.rolls, args.trials, args.horizon, args.seed))
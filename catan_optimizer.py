@@ -0,0 +1,192 @@
+#!/usr/bin/python3.11
+# Tunes the trade profiles of the AI personalities (catan.TRADE_PROFILES) by
+# self-play across a process pool.
+#
+# Each round mutates the current profile of a personality into a few
+# candidates. A candidate plays the same seeded games, from the same seat
+# against the same stock opponents, as the current profile, and the two are
+# compared on the games only one of them won. A sequential probability ratio
+# test (SPRT) on those games stops as soon as a candidate is clearly no better,
+# or clearly better; only the close calls use the full game budget. The best
+# clearly better candidate becomes the current profile for the next round.
+#
+# The tuned profiles are printed and can be saved as JSON; apply them with
+# catan.set_trade_profile(personality, profile).
+
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import random
+
+import catan
+
+PERSONALITIES = ("generous", "greedy", "fair")
+
+# Tuned parameters and their bounds; strict is kept from the stock profile
+PARAMETERS = {
+    'accept_ratio': (0.5, 1.5),
+    'helps_ratio': (0.0, 1.5),
+    'counter_ratio': (0.8, 1.6),
+}
+
+
+def game_seed(seed, game_number):
+    return catan.derive_seed(seed, 'optimizer', game_number)
+
+
+def profile_name(personality, profile):
+    # Names are unique per profile, so cached trade decisions never mix profiles
+    values = "/".join(f"{profile[key]:.2f}" for key in PARAMETERS)
+    return f"{personality}@{values}"
+
+
+def play_games(task):
+    # Plays games first_game.. with the tuned seat using the given profile; returns
+    # 1 for each game the tuned seat won and 0 otherwise
+    personality, profile, seed, first_game, count, max_turns = task
+    name = profile_name(personality, profile)
+    catan.set_trade_profile(name, profile)
+    orders = list(itertools.permutations(PERSONALITIES))
+    outcomes = []
+    for game_number in range(first_game, first_game + count):
+        lineup = orders[game_number % len(orders)]
+        seat = lineup.index(personality)
+        seats = lineup[:seat] + (name,) + lineup[seat + 1:]
+        result = catan.simulate(seed=game_seed(seed, game_number), personalities=seats, max_turns=max_turns)
+        outcomes.append(1 if result.winner_seat == seat else 0)
+    return outcomes
+
+
+class SPRT:
+    # Sequential test on the games exactly one of candidate and current profile won:
+    # H0 the candidate wins half of them, H1 it wins 0.5 + delta of them
+    def __init__(self, delta=0.1, alpha=0.05, beta=0.05):
+        p1 = 0.5 + delta
+        self.win_step = math.log(p1 / 0.5)
+        self.loss_step = math.log((1 - p1) / 0.5)
+        self.upper = math.log((1 - beta) / alpha)
+        self.lower = math.log(beta / (1 - alpha))
+        self.llr = 0.0
+        self.wins = 0
+        self.losses = 0
+        self.games = 0
+
+    def add(self, candidate, current):
+        self.games += 1
+        if candidate and not current:
+            self.wins += 1
+            self.llr += self.win_step
+        elif current and not candidate:
+            self.losses += 1
+            self.llr += self.loss_step
+
+    def decision(self):
+        if self.llr >= self.upper:
+            return 'better'
+        if self.llr <= self.lower:
+            return 'worse'
+        return None
+
+
+def mutate(profile, rng, step):
+    candidate = dict(profile)
+    for key, (low, high) in PARAMETERS.items():
+        value = profile[key] + rng.gauss(0.0, step * (high - low))
+        candidate[key] = round(min(high, max(low, value)), 2)
+    return candidate
+
+
+def run_batches(pool, tasks):
+    if pool is None:
+        return list(map(play_games, tasks))
+    return pool.map(play_games, tasks)
+
+
+def tune(personality, pool, rounds=5, candidates=8, batch=50, max_games=1000, seed=0, max_turns=2000,
+         delta=0.1, alpha=0.05, beta=0.05, step=0.1, log=print):
+    rng = random.Random(catan.derive_seed(seed, 'optimizer', personality))
+    current = dict(catan.TRADE_PROFILES[personality])
+    games_played = 0
+    games_budgeted = 0
+    for round_number in range(1, rounds + 1):
+        trials = [(mutate(current, rng, step), SPRT(delta, alpha, beta)) for _ in range(candidates)]
+        # The current profile's outcomes are shared by every candidate in the round
+        baseline = []
+        live = list(range(len(trials)))
+        done = 0
+        while live and done < max_games:
+            count = min(batch, max_games - done)
+            tasks = [(personality, current, seed, done, count, max_turns)]
+            tasks += [(personality, trials[i][0], seed, done, count, max_turns) for i in live]
+            results = run_batches(pool, tasks)
+            baseline += results[0]
+            games_played += count * len(tasks)
+            for i, outcomes in zip(live, results[1:]):
+                test = trials[i][1]
+                for candidate, current_won in zip(outcomes, baseline[done:]):
+                    test.add(candidate, current_won)
+            done += count
+            live = [i for i in live if trials[i][1].decision() is None]
+        games_budgeted += max_games * (len(trials) + 1)
+
+        better = [(profile, test) for profile, test in trials if test.decision() == 'better']
+        log(f"{personality} round {round_number}: {len(better)} better, "
+            f"{sum(test.decision() == 'worse' for _, test in trials)} worse, "
+            f"{sum(test.decision() is None for _, test in trials)} undecided after {done} games")
+        if better:
+            profile, test = max(better, key=lambda item: item[1].wins / max(1, item[1].wins + item[1].losses))
+            log(f"  adopting {profile_name(personality, profile)} "
+                f"(won {test.wins} to {test.losses} of the games only one side won)")
+            current = profile
+    return current, games_played, games_budgeted
+
+
+def optimize(personalities=PERSONALITIES, processes=None, log=print, **options):
+    # Returns the tuned profiles and how many games were played out of the full budget
+    tuned = {}
+    played = 0
+    budgeted = 0
+    pool = None if processes == 1 else multiprocessing.Pool(processes)
+    try:
+        for personality in personalities:
+            profile, games, budget = tune(personality, pool, log=log, **options)
+            tuned[personality] = profile
+            played += games
+            budgeted += budget
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return tuned, played, budgeted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tune the AI trade profiles by parallel self-play.")
+    parser.add_argument("--personalities", nargs="+", default=list(PERSONALITIES), choices=PERSONALITIES)
+    parser.add_argument("-p", "--processes", type=int, default=None)
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=8, help="candidate profiles per round")
+    parser.add_argument("--batch", type=int, default=50, help="games per candidate between tests")
+    parser.add_argument("--max-games", type=int, default=1000, help="games per candidate before giving up")
+    parser.add_argument("--max-turns", type=int, default=2000)
+    parser.add_argument("--delta", type=float, default=0.1, help="edge over the current profile worth detecting")
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    parser.add_argument("--step", type=float, default=0.1, help="mutation size, as a fraction of each range")
+    parser.add_argument("-o", "--output", help="write the tuned profiles to this JSON file")
+    args = parser.parse_args()
+
+    tuned, played, budgeted = optimize(
+        tuple(args.personalities), args.processes, seed=args.seed, rounds=args.rounds, candidates=args.candidates,
+        batch=args.batch, max_games=args.max_games, max_turns=args.max_turns, delta=args.delta, alpha=args.alpha,
+        beta=args.beta, step=args.step,
+    )
+    print(f"\nPlayed {played} of {budgeted} budgeted games ({1 - played / budgeted:.0%} saved by early stopping)")
+    for personality, profile in tuned.items():
+        print(f"{personality:<10} {profile}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(tuned, f, indent=2)
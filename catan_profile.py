@@ -0,0 +1,230 @@
+#!/usr/bin/python3.11
+# Per-phase timing and counters for catan.py games.
+#
+# TurnProfiler is an event sink. Attaching it to a game also wraps that game's
+# turn phases (roll, production, AI and human actions, building, trading and
+# rendering) with timers, by setting instance attributes that shadow the Game
+# methods. Games it is not attached to run the plain methods, so profiling costs
+# nothing unless it is switched on. Times are inclusive (a turn includes its
+# trades) and leave out the time a phase spends waiting for a human's answer.
+
+import argparse
+import bisect
+import json
+import time
+
+import catan
+
+# Upper bounds of the histogram buckets, in microseconds; the last bucket is open
+BUCKETS_US = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000)
+
+# phase name -> (Game method, whether it is a prompt generator)
+PHASES = {
+    'turn': ('turn_steps', True),
+    'roll': ('roll_dice', False),
+    'production': ('distribute_resources', False),
+    'ai_action': ('ai_steps', True),
+    'human_action': ('human_steps', True),
+    'ai_build': ('ai_build', False),
+    'trade': ('trade_steps', True),
+    'render_board': ('render_board', False),
+    'render_state': ('render_game_state', False),
+}
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_US) + 1)
+        self.count = 0
+        self.total_ns = 0
+        self.min_ns = None
+        self.max_ns = 0
+
+    def add(self, ns):
+        self.counts[bisect.bisect_left(BUCKETS_US, ns / 1000)] += 1
+        self.count += 1
+        self.total_ns += ns
+        if self.min_ns is None or ns < self.min_ns:
+            self.min_ns = ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def percentile(self, fraction):
+        # Upper bound of the bucket holding the given fraction of samples, in microseconds
+        target = fraction * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target and n:
+                return BUCKETS_US[i] if i < len(BUCKETS_US) else self.max_ns / 1000
+        return 0.0
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'total_ms': self.total_ns / 1e6,
+            'mean_us': self.total_ns / self.count / 1000 if self.count else 0.0,
+            'min_us': (self.min_ns or 0) / 1000,
+            'max_us': self.max_ns / 1000,
+            'p50_us': self.percentile(0.5),
+            'p90_us': self.percentile(0.9),
+            'p99_us': self.percentile(0.99),
+            'buckets_us': {str(b): n for b, n in zip(BUCKETS_US + ('inf',), self.counts) if n},
+        }
+
+
+def timed(method, histogram, clock=time.perf_counter_ns):
+    def wrapper(*args, **kwargs):
+        start = clock()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            histogram.add(clock() - start)
+    return wrapper
+
+
+def timed_steps(method, histogram, clock=time.perf_counter_ns):
+    # Like timed, for the prompt generators: the clock stops while a prompt waits
+    def wrapper(*args, **kwargs):
+        steps = method(*args, **kwargs)
+        spent = 0
+        start = clock()
+        try:
+            prompt = next(steps)
+            while True:
+                spent += clock() - start
+                answer = yield prompt
+                start = clock()
+                prompt = steps.send(answer)
+        except StopIteration as done:
+            histogram.add(spent + clock() - start)
+            return done.value
+    return wrapper
+
+
+class TurnProfiler(catan.Sink):
+    def __init__(self, phases=tuple(PHASES), dump_every=None, dump=None):
+        # dump_every: write report() every that many turns, to dump (a callable
+        # taking the report, or a path that gets one JSON line per dump)
+        self.phases = phases
+        self.dump_every = dump_every
+        self.dump = dump
+        self.reset()
+
+    def reset(self):
+        self.histograms = {name: Histogram() for name in self.phases}
+        self.counters = {}
+        self.turns = 0
+        self.started = time.perf_counter()
+
+    def install(self, game):
+        # Profiles a game that is already running; new games can take the profiler as a sink
+        game.events.add(self)
+        self.attach(game)
+
+    def attach(self, game):
+        for name in self.phases:
+            method_name, is_steps = PHASES[name]
+            method = getattr(game, method_name)
+            wrap = timed_steps if is_steps else timed
+            setattr(game, method_name, wrap(method, self.histograms[name]))
+
+    def detach(self, game):
+        # Puts the plain methods back; the numbers collected so far are kept
+        for name in self.phases:
+            game.__dict__.pop(PHASES[name][0], None)
+
+    def count(self, key, amount=1):
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def handle(self, event):
+        kind = event.kind
+        if kind == catan.TURN:
+            self.turns += 1
+            if self.dump_every and self.turns % self.dump_every == 0:
+                self.write_dump()
+        elif kind == catan.ROLL:
+            if event.data['roll'] == 7:
+                self.count('sevens')
+        elif kind == catan.PRODUCE:
+            self.count('resources_produced', event.data['amount'])
+        elif kind == catan.BUILD:
+            self.count(f"build_{event.data['item']}")
+        elif kind == catan.TRADE_OFFER:
+            self.count('trades_attempted')
+        elif kind == catan.TRADE_ACCEPT:
+            self.count('trades_accepted_countered' if event.data['countered'] else 'trades_accepted')
+        elif kind == catan.TRADE_COUNTER:
+            self.count('counter_offers')
+        elif kind == catan.TRADE_DECLINE:
+            self.count('trade_declines')
+        elif kind == catan.TRADE_FAIL:
+            self.count('trades_failed')
+        elif kind == catan.PASS:
+            self.count('passes')
+        elif kind == catan.BONUS:
+            self.count('passes_with_bonus')
+        elif kind == catan.LONGEST_ROAD:
+            self.count('longest_road_changes')
+        elif kind == catan.GAME_OVER:
+            self.count('games_finished')
+
+    def report(self):
+        return {
+            'turns': self.turns,
+            'seconds': time.perf_counter() - self.started,
+            'phases': {name: h.summary() for name, h in self.histograms.items() if h.count},
+            'counters': dict(sorted(self.counters.items())),
+        }
+
+    def write_dump(self):
+        report = self.report()
+        if self.dump is None:
+            print(format_report(report))
+        elif callable(self.dump):
+            self.dump(report)
+        else:
+            with open(self.dump, 'a') as f:
+                f.write(json.dumps(report) + "\n")
+
+
+def format_report(report):
+    lines = [f"--- {report['turns']} turns in {report['seconds']:.2f}s ---"]
+    lines.append(f"{'phase':<14} {'calls':>9} {'total ms':>10} {'mean us':>9} {'p50 us':>8} {'p90 us':>8} {'p99 us':>8} {'max us':>9}")
+    for name, row in report['phases'].items():
+        lines.append(f"{name:<14} {row['count']:>9} {row['total_ms']:>10.1f} {row['mean_us']:>9.1f} "
+                     f"{row['p50_us']:>8.0f} {row['p90_us']:>8.0f} {row['p99_us']:>8.0f} {row['max_us']:>9.1f}")
+    for key, value in report['counters'].items():
+        lines.append(f"{key:<28} {value:>9}")
+    return "\n".join(lines)
+
+
+def profile_games(games=100, seed=0, personalities=("generous", "greedy", "fair"), max_turns=2000, render=False,
+                  dump_every=None, dump=None):
+    # Seeded all-AI games under one profiler. With render the games also draw the
+    # terminal output, into a throwaway writer, so rendering shows up in the numbers.
+    profiler = TurnProfiler(dump_every=dump_every, dump=dump)
+    for game_seed in range(seed, seed + games):
+        sinks = [profiler]
+        if render:
+            sinks.append(catan.TerminalSink(write=lambda text: None))
+        game = catan.Game(seed=game_seed, personalities=personalities, sinks=sinks)
+        game.play(max_turns=max_turns)
+        game.close()
+    return profiler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile the phases of seeded all-AI Catan games.")
+    parser.add_argument("-n", "--games", type=int, default=100)
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("--max-turns", type=int, default=2000)
+    parser.add_argument("--render", action="store_true", help="also render the terminal output")
+    parser.add_argument("--dump-every", type=int, default=None, help="print or write a report every N turns")
+    parser.add_argument("--dump", default=None, help="append periodic reports to this JSON lines file")
+    parser.add_argument("--json", action="store_true", help="print the final report as JSON")
+    args = parser.parse_args()
+    profiler = profile_games(args.games, args.seed, max_turns=args.max_turns, render=args.render,
+                             dump_every=args.dump_every, dump=args.dump)
+    report = profiler.report()
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
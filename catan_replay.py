@@ -0,0 +1,326 @@
+#!/usr/bin/python3.11
+# Append-only binary replay logs for catan.py games.
+#
+# ReplayWriter is an event sink that packs every game event into a few bytes
+# and, every `checkpoint_every` turns, a full Game.encode() checkpoint. Many
+# games can be appended to one file. ReplayLog indexes a file and rebuilds the
+# state at the start of any turn from the nearest checkpoint by applying the
+# recorded events; no AI decisions or rendering are re-run.
+#
+# Record layout: kind (B), payload length (B, or I for checkpoints and game
+# starts, as a checkpoint of a large board runs past 64 KiB), payload. Trade
+# amounts are packed as I. Longest Road changes are not recorded: replaying
+# the roads works them out again.
+
+import argparse
+import mmap
+import struct
+
+import catan
+
+LOG_MAGIC = b'CTR4'
+
+GAME_START = 1
+CHECKPOINT = 2
+GAME_END = 3
+
+# Codes for the events that are recorded; state and message events are not
+EVENT_CODES = {
+    catan.TURN: 10,
+    catan.ROLL: 11,
+    catan.PRODUCE: 12,
+    catan.BUILD: 13,
+    catan.TRADE_OFFER: 14,
+    catan.TRADE_ACCEPT: 15,
+    catan.TRADE_COUNTER: 16,
+    catan.TRADE_DECLINE: 17,
+    catan.TRADE_FAIL: 18,
+    catan.PASS: 19,
+    catan.BONUS: 20,
+    catan.GAME_OVER: 21,
+}
+EVENT_KINDS = {code: kind for kind, code in EVENT_CODES.items()}
+LONG_RECORDS = (GAME_START, CHECKPOINT)
+# Bytes before the payload of a long record
+LONG_HEADER = 5
+
+BUILD_ITEMS = ('settlement', 'city', 'road')
+BUILD_CODES = {item: i for i, item in enumerate(BUILD_ITEMS)}
+BUILD_COSTS = (catan.SETTLEMENT_VECTOR, catan.CITY_VECTOR, catan.ROAD_VECTOR)
+NO_HEX = 0xFFFF
+
+
+def pack_resources(resources):
+    out = bytearray([len(resources)])
+    for r, amt in resources.items():
+        out += struct.pack('<BI', catan.RESOURCE_INDEX[r], amt)
+    return out
+
+
+def unpack_resources(data, offset):
+    count = data[offset]
+    offset += 1
+    resources = {}
+    for _ in range(count):
+        code, amt = struct.unpack_from('<BI', data, offset)
+        resources[catan.RESOURCES[code]] = amt
+        offset += 5
+    return resources, offset
+
+
+class ReplayWriter(catan.Sink):
+    def __init__(self, target, checkpoint_every=50, buffer_size=1 << 16):
+        self.owns_file = isinstance(target, str)
+        self.file = open(target, 'ab', buffering=buffer_size) if self.owns_file else target
+        if self.file.tell() == 0:
+            self.file.write(LOG_MAGIC)
+        self.checkpoint_every = checkpoint_every
+        self.game = None
+        self.seat = {}
+        self.ended = False
+        self.encoders = {
+            catan.TURN: self.encode_turn,
+            catan.ROLL: self.encode_roll,
+            catan.PRODUCE: self.encode_produce,
+            catan.BUILD: self.encode_build,
+            catan.TRADE_OFFER: self.encode_offer,
+            catan.TRADE_ACCEPT: self.encode_accept,
+            catan.TRADE_COUNTER: self.encode_counter,
+            catan.TRADE_DECLINE: self.encode_seat,
+            catan.TRADE_FAIL: self.encode_seat,
+            catan.PASS: self.encode_seat,
+            catan.BONUS: self.encode_bonus,
+            catan.GAME_OVER: self.encode_seat,
+        }
+
+    def write(self, code, payload):
+        if code in LONG_RECORDS:
+            self.file.write(struct.pack('<BI', code, len(payload)) + payload)
+        else:
+            self.file.write(struct.pack('<BB', code, len(payload)) + payload)
+
+    def attach(self, game):
+        self.game = game
+        self.seat = {id(p): i for i, p in enumerate(game.players)}
+        seed = b'' if game.seed is None else str(game.seed).encode()
+        self.write(GAME_START, struct.pack('<H', self.checkpoint_every) + seed)
+        self.write(CHECKPOINT, game.encode())
+
+    def handle(self, event):
+        encode = self.encoders.get(event.kind)
+        if encode is None:
+            return
+        if event.kind == catan.TURN and event.turn and event.turn % self.checkpoint_every == 0:
+            self.write(CHECKPOINT, self.game.encode())
+        self.write(EVENT_CODES[event.kind], encode(event))
+
+    def encode_seat(self, event):
+        return bytes([self.seat[id(event.player)]])
+
+    def encode_turn(self, event):
+        return struct.pack('<BI', self.seat[id(event.player)], event.turn)
+
+    def encode_roll(self, event):
+        return struct.pack('<BB', self.seat[id(event.player)], event.data['roll'])
+
+    def encode_produce(self, event):
+        data = event.data
+        return struct.pack('<BBHH', self.seat[id(event.player)], catan.RESOURCE_INDEX[data['resource']], data['amount'], data['hex'])
+
+    def encode_build(self, event):
+        # Settlements and cities give their hex; roads give the two hexes they join
+        data = event.data
+        a, b = data['edge'] if data['item'] == 'road' else (data['hex'], NO_HEX)
+        return struct.pack('<BBHH', self.seat[id(event.player)], BUILD_CODES[data['item']], a, b)
+
+    def encode_offer(self, event):
+        return bytes([self.seat[id(event.player)]]) + pack_resources(event.data['offer']) + pack_resources(event.data['request'])
+
+    def encode_accept(self, event):
+        data = event.data
+        head = struct.pack('<BB?', self.seat[id(event.player)], self.seat[id(data['partner'])], data['countered'])
+        return head + pack_resources(data['give']) + pack_resources(data['take'])
+
+    def encode_counter(self, event):
+        return bytes([self.seat[id(event.player)]]) + pack_resources(event.data['counter'])
+
+    def encode_bonus(self, event):
+        return struct.pack('<BB', self.seat[id(event.player)], catan.RESOURCE_INDEX[event.data['resource']])
+
+    def close(self):
+        if not self.ended:
+            self.ended = True
+            winner = self.game.winner
+            self.write(GAME_END, struct.pack('<BI', 0xFF if winner is None else self.seat[id(winner)], self.game.turns_played))
+        if self.owns_file:
+            self.file.close()
+        else:
+            self.file.flush()
+
+
+def decode_record(code, data, offset):
+    # Returns (kind, fields) for an event record starting at offset
+    kind = EVENT_KINDS[code]
+    if kind == catan.TURN:
+        return kind, struct.unpack_from('<BI', data, offset)
+    if kind == catan.ROLL:
+        return kind, struct.unpack_from('<BB', data, offset)
+    if kind == catan.PRODUCE:
+        return kind, struct.unpack_from('<BBHH', data, offset)
+    if kind == catan.BUILD:
+        return kind, struct.unpack_from('<BBHH', data, offset)
+    if kind == catan.TRADE_OFFER:
+        offer, next_offset = unpack_resources(data, offset + 1)
+        request, _ = unpack_resources(data, next_offset)
+        return kind, (data[offset], offer, request)
+    if kind == catan.TRADE_ACCEPT:
+        initiator, partner, countered = struct.unpack_from('<BB?', data, offset)
+        give, next_offset = unpack_resources(data, offset + 3)
+        take, _ = unpack_resources(data, next_offset)
+        return kind, (initiator, partner, countered, give, take)
+    if kind == catan.TRADE_COUNTER:
+        counter, _ = unpack_resources(data, offset + 1)
+        return kind, (data[offset], counter)
+    if kind == catan.BONUS:
+        return kind, struct.unpack_from('<BB', data, offset)
+    return kind, (data[offset],)
+
+
+class ReplayLog:
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:4] != LOG_MAGIC:
+            raise ValueError("not a Catan replay log")
+        self.games = self.index()
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def records(self, start, end):
+        data = self.data
+        offset = start
+        while offset < end:
+            code = data[offset]
+            if code in LONG_RECORDS:
+                length, = struct.unpack_from('<I', data, offset + 1)
+                header = LONG_HEADER
+            else:
+                length = data[offset + 1]
+                header = 2
+            yield code, offset, offset + header, length
+            offset += header + length
+
+    def index(self):
+        games = []
+        game = None
+        for code, offset, payload, length in self.records(4, len(self.data)):
+            if code == GAME_START:
+                every, = struct.unpack_from('<H', self.data, payload)
+                seed = bytes(self.data[payload + 2:payload + length]).decode()
+                game = {'seed': int(seed) if seed else None, 'checkpoint_every': every,
+                        'start': offset, 'end': None, 'checkpoints': [], 'winner': None, 'turns': None}
+                games.append(game)
+            elif code == CHECKPOINT:
+                turns, = struct.unpack_from('<I', self.data, payload + 8)
+                game['checkpoints'].append((turns, offset))
+            elif code == GAME_END:
+                winner, turns = struct.unpack_from('<BI', self.data, payload)
+                game['winner'] = None if winner == 0xFF else winner
+                game['turns'] = turns
+                game['end'] = payload + length
+        for game in games:
+            if game['end'] is None:
+                game['end'] = len(self.data)
+        return games
+
+    def events(self, game_no):
+        game = self.games[game_no]
+        for code, _, payload, _ in self.records(game['start'], game['end']):
+            if code in EVENT_KINDS:
+                yield decode_record(code, self.data, payload)
+
+    def state_at(self, game_no, turn=None):
+        # State at the start of `turn` (or at the end of the game when turn is None)
+        game = self.games[game_no]
+        checkpoint = game['checkpoints'][0]
+        for candidate in game['checkpoints']:
+            if turn is not None and candidate[0] > turn:
+                break
+            checkpoint = candidate
+        _, offset = checkpoint
+        length, = struct.unpack_from('<I', self.data, offset + 1)
+        start = offset + LONG_HEADER
+        state = catan.Game.decode(bytes(self.data[start:start + length]), seed=game['seed'])
+        players = state.players
+
+        for code, _, payload, _ in self.records(start + length, game['end']):
+            if code not in EVENT_KINDS:
+                continue
+            kind, fields = decode_record(code, self.data, payload)
+            if kind == catan.TURN:
+                if turn is not None and fields[1] >= turn:
+                    break
+                state.current_player_index = fields[0]
+                state.turns_played = fields[1] + 1
+            elif kind == catan.PRODUCE:
+                seat, resource, amount, _ = fields
+                players[seat].counts[resource] += amount
+            elif kind == catan.BUILD:
+                seat, item, hex_number, other = fields
+                player = players[seat]
+                player.spend_resources(BUILD_COSTS[item])
+                if item == 0:
+                    state.place_settlement(player, hex_number)
+                elif item == 1:
+                    state.upgrade_to_city(player, hex_number)
+                else:
+                    state.build_road(player, (hex_number, other))
+            elif kind == catan.TRADE_ACCEPT:
+                initiator, partner, _, give, take = fields
+                state.transfer(players[initiator], give, players[partner], take)
+            elif kind == catan.BONUS:
+                seat, resource = fields
+                players[seat].counts[resource] += 1
+            elif kind == catan.GAME_OVER:
+                state.winner = players[fields[0]]
+        # A TURN record marks the start of a turn; the index moves on once it is played
+        if turn is not None:
+            state.turns_played = turn
+            state.current_player_index = turn % state.total_players
+        else:
+            state.current_player_index = state.turns_played % state.total_players
+        return state
+
+
+def record_games(path, games, seed=0, personalities=("generous", "greedy", "fair"), checkpoint_every=50):
+    for game_seed in range(seed, seed + games):
+        writer = ReplayWriter(path, checkpoint_every=checkpoint_every)
+        catan.Game(seed=game_seed, personalities=personalities, sinks=[writer]).play()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record or inspect Catan replay logs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    record = sub.add_parser("record", help="play seeded all-AI games into a log")
+    record.add_argument("path")
+    record.add_argument("-n", "--games", type=int, default=100)
+    record.add_argument("-s", "--seed", type=int, default=0)
+    record.add_argument("--checkpoint-every", type=int, default=50)
+    show = sub.add_parser("show", help="print the state of a recorded game at a turn")
+    show.add_argument("path")
+    show.add_argument("-g", "--game", type=int, default=0)
+    show.add_argument("-t", "--turn", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record_games(args.path, args.games, args.seed, checkpoint_every=args.checkpoint_every)
+    else:
+        log = ReplayLog(args.path)
+        info = log.games[args.game]
+        print(f"Game {args.game} of {len(log.games)}: seed {info['seed']}, {info['turns']} turns")
+        state = log.state_at(args.game, args.turn)
+        print(state.render_board())
+        print(state.render_game_state())
+        log.close()
@@ -0,0 +1,303 @@
+#!/usr/bin/python3.11
+# Asyncio TCP server that hosts many catan.py games in one event loop.
+#
+# Each connection is one game: a human seat against the AI personalities. The
+# game runs as Game.play_steps(), so whenever the human has to answer, the
+# session awaits a line from its socket instead of blocking on input() and the
+# other sessions carry on.
+#
+# Protocol, one JSON object per line from the server:
+#   every game event, as written by JsonlSink ({"kind": "roll", ...})
+#   {"kind": "prompt", "text": ...}   the client answers with one line of text
+#   {"kind": "result", "winner": ..., "turns": ..., "seed": ...}
+#   {"kind": "error", "text": ...}    the session is over, e.g. the server is full
+
+import argparse
+import asyncio
+import itertools
+import json
+import time
+
+import catan
+
+PERSONALITIES = ("generous", "greedy", "fair")
+
+
+class StreamText:
+    # Lets JsonlSink write to an asyncio stream. Events are batched and go out in
+    # one write when the session next prompts or finishes.
+    def __init__(self, writer):
+        self.writer = writer
+        self.pending = []
+
+    def write(self, text):
+        self.pending.append(text)
+
+    def flush(self):
+        if self.pending:
+            self.writer.write("".join(self.pending).encode())
+            self.pending.clear()
+
+
+class GameServer:
+    def __init__(self, host="127.0.0.1", port=7878, seed=None, personalities=PERSONALITIES, max_turns=None,
+                 max_sessions=10000, answer_timeout=600, search_iterations=20, spectators=None):
+        self.host = host
+        self.port = port
+        # With a seed, session n plays the game seeded seed + n
+        self.seeds = itertools.count(seed) if seed is not None else None
+        self.personalities = personalities
+        self.max_turns = max_turns
+        self.max_sessions = max_sessions
+        self.answer_timeout = answer_timeout
+        # Searching seats run inside the event loop, so they get an iteration budget
+        # rather than wall-clock time
+        self.search_iterations = search_iterations
+        # A catan_spectator.Spectators that gets a view of every session's game
+        self.spectators = spectators
+        self.server = None
+        self.active = 0
+        self.started = 0
+        self.finished = 0
+        self.dropped = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    def close(self):
+        self.server.close()
+
+    async def handle(self, reader, writer):
+        if self.active >= self.max_sessions:
+            send(writer, {'kind': 'error', 'text': "server full"})
+            await close_writer(writer)
+            return
+        self.active += 1
+        self.started += 1
+        try:
+            await self.run_session(reader, writer)
+        except (ConnectionError, asyncio.TimeoutError):
+            self.dropped += 1
+        finally:
+            self.active -= 1
+            await close_writer(writer)
+
+    async def run_session(self, reader, writer):
+        name = await self.prompt(reader, writer, "Enter your name: ")
+        if name is None:
+            self.dropped += 1
+            return
+        seed = next(self.seeds) if self.seeds is not None else None
+        stream = StreamText(writer)
+        sinks = [catan.JsonlSink(stream)]
+        view = self.spectators.view() if self.spectators is not None else None
+        if view is not None:
+            sinks.append(view)
+        game = catan.Game(name.strip() or "Player", seed=seed, personalities=self.personalities,
+                          sinks=sinks, search_iterations=self.search_iterations)
+
+        steps = game.play_steps(self.max_turns)
+        try:
+            prompt = next(steps)
+            while True:
+                stream.flush()
+                answer = await self.prompt(reader, writer, prompt)
+                if answer is None:
+                    steps.close()
+                    self.dropped += 1
+                    return
+                prompt = steps.send(answer)
+        except StopIteration as done:
+            result = done.value
+            # A game cut short by max_turns is still open
+            game.close()
+        finally:
+            # Spectators stop waiting on a game whose player has gone
+            if view is not None:
+                view.close()
+
+        stream.flush()
+        self.finished += 1
+        send(writer, {
+            'kind': 'result',
+            'winner': result.winner.name if result.winner else None,
+            'turns': result.turns,
+            'seed': result.seed,
+        })
+        await writer.drain()
+
+    async def prompt(self, reader, writer, text):
+        # Sends the prompt after everything the game has said so far, then waits for
+        # one line; None when the client has gone
+        send(writer, {'kind': 'prompt', 'text': text})
+        await writer.drain()
+        line = await asyncio.wait_for(reader.readline(), self.answer_timeout)
+        if not line:
+            return None
+        # Bytes that are not UTF-8 become U+FFFD, which the game rejects like any bad answer
+        return line.decode(errors='replace').rstrip("\r\n")
+
+    def stats(self):
+        return {'active': self.active, 'started': self.started, 'finished': self.finished, 'dropped': self.dropped}
+
+
+# Unattended clients only decode the lines they act on
+REPLY_KINDS = (b'{"kind": "prompt"', b'{"kind": "result"', b'{"kind": "error"')
+
+
+def send(writer, row):
+    writer.write((json.dumps(row) + "\n").encode())
+
+
+async def close_writer(writer):
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except ConnectionError:
+        pass
+
+
+def describe(row):
+    # One line of text for a server message, for the interactive client
+    kind = row['kind']
+    if kind == catan.MESSAGE:
+        return row['text']
+    if kind == catan.TURN:
+        return f"\n{row['player']}'s turn"
+    if kind == catan.ROLL:
+        return f"{row['player']} rolled a {row['roll']}"
+    if kind == catan.PRODUCE:
+        return f"{row['player']} received {row['amount']} {row['resource']}"
+    if kind == catan.BUILD:
+        if row['item'] == 'road':
+            a, b = row['edge']
+            return f"{row['player']} built a road between hexes {a + 1} and {b + 1}"
+        return f"{row['player']} built a {row['item']} on hex {row['hex'] + 1}"
+    if kind == catan.LONGEST_ROAD:
+        return f"{row['player']} takes the Longest Road ({row['length']} roads)"
+    if kind == catan.TRADE_ACCEPT:
+        return f"{row['player']} traded {row['give']} to {row['partner']} for {row['take']}"
+    if kind == catan.PASS:
+        return f"{row['player']} passed"
+    if kind == catan.BONUS:
+        return f"{row['player']} received a bonus {row['resource']}"
+    if kind == catan.STATE:
+        return "\n".join(f"  {p['name']}: {p['victory_points']} VP {p['resources']}" for p in row['players'])
+    if kind == catan.GAME_OVER:
+        return f"\nGame Over! {row['player']} wins!"
+    if kind == 'result':
+        return f"Game finished after {row['turns']} turns, winner: {row['winner']}"
+    if kind == 'error':
+        return f"Server error: {row['text']}"
+    return None
+
+
+def auto_answer(name):
+    # Answers for unattended clients: pass every turn and turn down every trade
+    def answer(prompt):
+        if prompt.startswith("Enter your name"):
+            return name
+        if prompt.startswith("Choose an action"):
+            return "2"
+        return "n"
+    return answer
+
+
+async def run_client(host, port, answer=None, show=print):
+    # With no answer function the prompts are read from the terminal
+    loop = asyncio.get_running_loop()
+    reader, writer = await asyncio.open_connection(host, port)
+    result = None
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if show is None and not line.startswith(REPLY_KINDS):
+                continue
+            row = json.loads(line)
+            if row['kind'] == 'prompt':
+                if answer is None:
+                    text = await loop.run_in_executor(None, input, row['text'])
+                else:
+                    text = answer(row['text'])
+                writer.write((text + "\n").encode())
+                await writer.drain()
+                continue
+            if row['kind'] in ('result', 'error'):
+                result = row
+            if show is not None:
+                text = describe(row)
+                if text is not None:
+                    show(text)
+    finally:
+        await close_writer(writer)
+    return result
+
+
+async def load_test(clients=100, seed=0, personalities=PERSONALITIES, max_turns=2000):
+    # Starts a server on a free local port and plays `clients` unattended games against it at once
+    server = GameServer(port=0, seed=seed, personalities=personalities, max_turns=max_turns)
+    await server.start()
+    start = time.perf_counter()
+    results = await asyncio.gather(*(
+        run_client(server.host, server.port, answer=auto_answer(f"Bot {i + 1}"), show=None)
+        for i in range(clients)
+    ))
+    elapsed = time.perf_counter() - start
+    server.close()
+    await server.server.wait_closed()
+    finished = [r for r in results if r is not None and r['kind'] == 'result']
+    return {
+        'clients': clients,
+        'finished': len(finished),
+        'turns': sum(r['turns'] for r in finished),
+        'seconds': elapsed,
+        'server': server.stats(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Host or play Catan games over TCP.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="run the game server")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=7878)
+    serve.add_argument("-s", "--seed", type=int, default=None)
+    serve.add_argument("--max-turns", type=int, default=None)
+    serve.add_argument("--max-sessions", type=int, default=10000)
+    serve.add_argument("--personalities", nargs="+", default=list(PERSONALITIES))
+    serve.add_argument("--spectator-port", type=int, default=None, help="also serve the games to spectators over HTTP")
+    play = sub.add_parser("play", help="play a game on a server from this terminal")
+    play.add_argument("--host", default="127.0.0.1")
+    play.add_argument("--port", type=int, default=7878)
+    load = sub.add_parser("load", help="play many unattended games against an in-process server")
+    load.add_argument("-n", "--clients", type=int, default=100)
+    load.add_argument("-s", "--seed", type=int, default=0)
+    load.add_argument("--max-turns", type=int, default=2000)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        spectators = None
+        if args.spectator_port is not None:
+            import catan_spectator
+
+            spectators = catan_spectator.Spectators()
+            catan_spectator.serve(spectators, args.host, args.spectator_port)
+        server = GameServer(args.host, args.port, args.seed, tuple(args.personalities), args.max_turns, args.max_sessions,
+                            spectators=spectators)
+        asyncio.run(server.serve_forever())
+    elif args.command == "play":
+        asyncio.run(run_client(args.host, args.port))
+    else:
+        report = asyncio.run(load_test(args.clients, args.seed, max_turns=args.max_turns))
+        print(f"{report['finished']} of {report['clients']} games finished, {report['turns']} turns "
+              f"in {report['seconds']:.2f}s ({report['turns'] / report['seconds']:.0f} turns/s)")
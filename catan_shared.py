@@ -0,0 +1,336 @@
+#!/usr/bin/python3.11
+# catan.py positions in shared memory, for parallel rollouts without shipping
+# the game to every worker.
+#
+# SharedPosition keeps a position in a multiprocessing.shared_memory block with
+# a fixed layout: the board's resources and numbers, each hex's owners and
+# cities as seat bitmasks, each board edge's road owner, and the players'
+# resource counters and victory points. The parent publishes a new position
+# into the same block; workers attach once by name, read the arrays in place
+# and fork their own rollouts from a local game, built once and then restored
+# to each new position.
+#
+# Layout, little-endian:
+#   header   magic, version, hex count, player count, current seat, width, turns,
+#            Longest Road holder
+#   board    resource code (B) and number (B) per hex, written once
+#   owners   seat bitmask (B) per hex, and a second one for the seats with a city
+#   roads    owner seat (B, NO_SEAT for none) per slot of the adjacency array
+#   players  resource counts (5 i) and victory points (i) per seat
+#   players' names, personalities and human flags as JSON, written once
+#
+# Writers bump the version to an odd number, write, and bump it again; readers
+# retry until they see the same even version before and after reading.
+
+import argparse
+import json
+import multiprocessing
+import struct
+import time
+from array import array
+from multiprocessing import shared_memory
+
+import catan
+import catan_mcts
+
+MAGIC = b'CTSM'
+HEADER = struct.Struct('<4sIHBBHIB')
+MAX_SEATS = 8
+NO_SEAT = catan.NO_SEAT
+
+
+def align(offset):
+    return (offset + 3) & ~3
+
+
+def layout(hex_count, player_count, slots):
+    # Offsets of each section; every section starts on a 4-byte boundary
+    offsets = {}
+    offset = align(HEADER.size)
+    for name, size in (('resources', hex_count), ('numbers', hex_count), ('owners', hex_count),
+                       ('cities', hex_count), ('roads', slots), ('counts', 4 * 5 * player_count),
+                       ('points', 4 * player_count), ('meta', 0)):
+        offsets[name] = offset
+        offset = align(offset + size)
+    return offsets
+
+
+class SharedPosition:
+    def __init__(self, shm, created):
+        self.shm = shm
+        self.created = created
+        buf = shm.buf
+        _, _, hex_count, player_count, _, width, _, _ = HEADER.unpack_from(buf, 0)
+        self.hex_count = hex_count
+        self.player_count = player_count
+        self.width = width
+        self.adjacency_offsets, self.adjacency = catan.hex_adjacency(hex_count, width)
+        offsets = layout(hex_count, player_count, len(self.adjacency))
+        # Views into the block; nothing is copied
+        self.resources = buf[offsets['resources']:offsets['resources'] + hex_count]
+        self.numbers = buf[offsets['numbers']:offsets['numbers'] + hex_count]
+        self.owners = buf[offsets['owners']:offsets['owners'] + hex_count]
+        self.cities = buf[offsets['cities']:offsets['cities'] + hex_count]
+        self.roads = buf[offsets['roads']:offsets['roads'] + len(self.adjacency)]
+        self.counts = buf[offsets['counts']:offsets['counts'] + 20 * player_count].cast('i')
+        self.points = buf[offsets['points']:offsets['points'] + 4 * player_count].cast('i')
+        meta = offsets['meta']
+        length, = struct.unpack_from('<I', buf, meta)
+        self.seats = json.loads(bytes(buf[meta + 4:meta + 4 + length]))
+        # The local game for the last version read, which rollouts are cloned from
+        self.cached_version = None
+        self.cached_game = None
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @classmethod
+    def create(cls, game, name=None):
+        if len(game.players) > MAX_SEATS:
+            raise ValueError(f"shared positions hold at most {MAX_SEATS} players")
+        hex_count = len(game.board)
+        slots = len(game.adjacency)
+        meta = json.dumps([[p.name, p.personality, p.is_human] for p in game.players]).encode()
+        offsets = layout(hex_count, len(game.players), slots)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=offsets['meta'] + 4 + len(meta))
+        buf = shm.buf
+        HEADER.pack_into(buf, 0, MAGIC, 0, hex_count, len(game.players), 0, game.board_width, 0, NO_SEAT)
+        buf[offsets['resources']:offsets['resources'] + hex_count] = bytes(
+            catan.BOARD_RESOURCE_CODES[hex_['resource']] for hex_ in game.board)
+        buf[offsets['numbers']:offsets['numbers'] + hex_count] = bytes(hex_['number'] for hex_ in game.board)
+        struct.pack_into('<I', buf, offsets['meta'], len(meta))
+        buf[offsets['meta'] + 4:offsets['meta'] + 4 + len(meta)] = meta
+        position = cls(shm, created=True)
+        position.publish(game)
+        return position
+
+    @classmethod
+    def attach(cls, name):
+        # Attach from the creator's own worker processes: they share its resource
+        # tracker, which then removes the block once, when the creator unlinks it
+        shm = shared_memory.SharedMemory(name=name)
+        if bytes(shm.buf[:4]) != MAGIC:
+            shm.close()
+            raise ValueError("not a shared Catan position")
+        return cls(shm, created=False)
+
+    def version(self):
+        return struct.unpack_from('<I', self.shm.buf, 4)[0]
+
+    def publish(self, game):
+        # Writes the game's changing state over the previous position
+        seat = {id(p): i for i, p in enumerate(game.players)}
+        owners = bytearray(self.hex_count)
+        cities = bytearray(self.hex_count)
+        for h in game.owned_hexes:
+            for owner in game.board[h]['owner']:
+                owners[h] |= 1 << seat[id(owner)]
+        for i, player in enumerate(game.players):
+            for h in player.cities:
+                cities[h] |= 1 << i
+        roads = bytearray([NO_SEAT]) * len(self.adjacency)
+        offsets = self.adjacency_offsets
+        adjacency = self.adjacency
+        for (a, b), owner in game.road_owner.items():
+            for slot in range(offsets[a], offsets[a + 1]):
+                if adjacency[slot] == b:
+                    roads[slot] = seat[id(owner)]
+                    break
+        counts = array('i')
+        for player in game.players:
+            counts.extend(player.counts)
+        holder = seat[id(game.longest_road_holder)] if game.longest_road_holder else NO_SEAT
+
+        buf = self.shm.buf
+        version = self.version()
+        struct.pack_into('<I', buf, 4, version + 1)
+        self.owners[:] = owners
+        self.cities[:] = cities
+        self.roads[:] = roads
+        self.counts[:] = counts
+        self.points[:] = array('i', (p.victory_points for p in game.players))
+        HEADER.pack_into(buf, 0, MAGIC, version + 1, self.hex_count, self.player_count, game.current_player_index,
+                         self.width, game.turns_played, holder)
+        struct.pack_into('<I', buf, 4, version + 2)
+
+    def snapshot(self):
+        # (version, Game.snapshot() of the current position), read straight from the block
+        buf = self.shm.buf
+        while True:
+            version = self.version()
+            if version & 1:
+                continue
+            _, _, _, _, current, _, turns, holder = HEADER.unpack_from(buf, 0)
+            owners = bytes(self.owners)
+            cities = bytes(self.cities)
+            roads = bytes(self.roads)
+            counts = self.counts.tolist()
+            points = self.points.tolist()
+            if self.version() == version:
+                break
+
+        owned = [h for h, mask in enumerate(owners) if mask]
+        seats = range(self.player_count)
+        owner_seats = tuple((h, tuple(i for i in seats if owners[h] >> i & 1)) for h in owned)
+        roads_by_seat = [[] for _ in seats]
+        offsets = self.adjacency_offsets
+        adjacency = self.adjacency
+        for a in range(self.hex_count):
+            for slot in range(offsets[a], offsets[a + 1]):
+                owner = roads[slot]
+                if owner != NO_SEAT:
+                    roads_by_seat[owner].append((a, adjacency[slot]))
+        players = []
+        for i in seats:
+            bit = 1 << i
+            players.append((
+                array('i', counts[5 * i:5 * i + 5]).tobytes(),
+                points[i],
+                array('H', [h for h in owned if owners[h] & bit and not cities[h] & bit]).tobytes(),
+                array('H', [h for h in owned if cities[h] & bit]).tobytes(),
+                tuple(roads_by_seat[i]),
+            ))
+        return version, (owner_seats, tuple(players), current, turns, holder if holder != NO_SEAT else None)
+
+    def read(self):
+        # (version, game) for the current position, as a fresh local Game
+        version, snapshot = self.snapshot()
+        players = [catan.Player(name, is_human=is_human, personality=personality)
+                   for name, personality, is_human in self.seats]
+        board = [(catan.BOARD_RESOURCES[code], number, ()) for code, number in zip(self.resources, self.numbers)]
+        game = catan.Game.assemble(players, board, self.width, 0, 0)
+        game.restore(snapshot)
+        return version, game
+
+    def fork(self, seed=None):
+        # A local copy of the current position for one rollout. The local game is built
+        # once; after that it is only restored to a new position when one is published.
+        if self.cached_game is None:
+            self.cached_version, self.cached_game = self.read()
+            for player in self.cached_game.players:
+                player.is_human = False
+        elif self.cached_version != self.version():
+            self.cached_version, snapshot = self.snapshot()
+            self.cached_game.restore(snapshot)
+        return self.cached_game.clone(seed=seed)
+
+    def close(self):
+        for view in (self.resources, self.numbers, self.owners, self.cities, self.roads, self.counts, self.points):
+            view.release()
+        self.shm.close()
+
+    def unlink(self):
+        if self.created:
+            self.shm.unlink()
+
+
+# Positions this worker process has attached to, by block name
+ATTACHED = {}
+
+
+def attached(name):
+    position = ATTACHED.get(name)
+    if position is None:
+        position = ATTACHED[name] = SharedPosition.attach(name)
+    return position
+
+
+def rollout_task(task):
+    # Runs `count` rollouts of the shared position; returns the summed value for seat
+    name, seed, count, rounds, seat = task
+    position = attached(name)
+    total = 0.0
+    for i in range(count):
+        sim = position.fork(seed=catan.derive_seed(seed, 'rollout', i))
+        sim.rollout(rounds * sim.total_players)
+        total += catan_mcts.evaluate(sim, seat)
+    return total
+
+
+def encoded_rollout_task(task):
+    # The same rollouts from a game shipped with the task, for comparison
+    data, seed, count, rounds, seat = task
+    game = catan.Game.decode(data)
+    for player in game.players:
+        player.is_human = False
+    total = 0.0
+    for i in range(count):
+        sim = game.clone(seed=catan.derive_seed(seed, 'rollout', i))
+        sim.rollout(rounds * sim.total_players)
+        total += catan_mcts.evaluate(sim, seat)
+    return total
+
+
+class RolloutPool:
+    # A process pool whose workers evaluate positions published to one shared block
+    def __init__(self, game, processes=None):
+        self.position = SharedPosition.create(game)
+        self.pool = multiprocessing.Pool(processes)
+
+    def evaluate(self, game, seat, rollouts=400, rounds=3, seed=0, chunk=25):
+        # Mean rollout value of the game's position for seat
+        self.position.publish(game)
+        tasks = [(self.position.name, catan.derive_seed(seed, 'chunk', start), min(chunk, rollouts - start), rounds, seat)
+                 for start in range(0, rollouts, chunk)]
+        return sum(self.pool.map(rollout_task, tasks)) / rollouts
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        self.position.close()
+        self.position.unlink()
+
+
+def compare(positions=20, rollouts=200, rounds=3, chunk=5, processes=None, seed=0,
+            board_size=catan.STANDARD_BOARD_SIZE):
+    # Times evaluating a series of positions through shared memory and by shipping
+    # each one to the workers with every task
+    games = []
+    game = catan.Game(seed=seed, headless=True, board_size=board_size)
+    for _ in range(positions):
+        game.play(max_turns=game.turns_played + 3)
+        games.append(game.clone())
+
+    pool = RolloutPool(games[0], processes)
+    try:
+        # Starts the workers and builds their local games outside the timings
+        pool.evaluate(games[0], 0, rollouts, rounds, seed, chunk)
+        start = time.perf_counter()
+        shared = [pool.evaluate(g, g.current_player_index, rollouts, rounds, seed, chunk) for g in games]
+        shared_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        shipped = []
+        for g in games:
+            data = g.encode()
+            tasks = [(data, catan.derive_seed(seed, 'chunk', s), min(chunk, rollouts - s), rounds, g.current_player_index)
+                     for s in range(0, rollouts, chunk)]
+            shipped.append(sum(pool.pool.map(encoded_rollout_task, tasks)) / rollouts)
+        shipped_seconds = time.perf_counter() - start
+    finally:
+        pool.close()
+    return {
+        'positions': positions,
+        'rollouts': rollouts,
+        'shared_seconds': shared_seconds,
+        'shipped_seconds': shipped_seconds,
+        'same_values': shared == shipped,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate positions with rollouts over a shared-memory position.")
+    parser.add_argument("--positions", type=int, default=20)
+    parser.add_argument("--rollouts", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--chunk", type=int, default=5, help="rollouts per worker task")
+    parser.add_argument("-p", "--processes", type=int, default=None)
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("--board-size", type=int, default=catan.STANDARD_BOARD_SIZE)
+    args = parser.parse_args()
+    report = compare(args.positions, args.rollouts, args.rounds, args.chunk, args.processes, args.seed, args.board_size)
+    print(f"{report['positions']} positions x {report['rollouts']} rollouts")
+    print(f"shared memory: {report['shared_seconds']:.2f}s")
+    print(f"shipped games: {report['shipped_seconds']:.2f}s")
+    print("values match" if report['same_values'] else "values differ")
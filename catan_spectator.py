@@ -0,0 +1,307 @@
+#!/usr/bin/python3.11
+# Local HTTP API for watching running catan.py games.
+#
+# A GameView is an event sink that keeps a game's board, state table and
+# recent actions ready to serve. Each event only refreshes what it touched: a
+# build redraws one board row, a trade two players' rows, and so on. Every
+# part has its own version, and rendered responses are cached per version, so
+# polling an unchanged game renders nothing; a poll with the current ETag in
+# If-None-Match gets a 304 without touching the game at all.
+#
+# Endpoints (JSON by default, ?format=text for the terminal rendering):
+#   GET /games                     every watched game
+#   GET /games/<id>                board, state table and recent actions
+#   GET /games/<id>/board
+#   GET /games/<id>/state
+#   GET /games/<id>/log
+
+import argparse
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import catan
+import catan_server
+
+PARTS = ('board', 'state', 'log')
+# Events that change a player's row of the state table
+STATE_EVENTS = (catan.PRODUCE, catan.BUILD, catan.TRADE_ACCEPT, catan.BONUS, catan.LONGEST_ROAD)
+
+
+class GameView(catan.Sink):
+    def __init__(self, game_id, log_size=50):
+        self.id = game_id
+        self.lock = threading.Lock()
+        self.game = None
+        self.seats = {}
+        self.versions = dict.fromkeys(PARTS, 0)
+        self.log = deque(maxlen=log_size)
+        self.turn = 0
+        self.winner = None
+        self.finished = False
+        # Rendered responses by (part, format): (etag, body)
+        self.cache = {}
+
+    def attach(self, game):
+        with self.lock:
+            self.game = game
+            self.seats = {id(p): i for i, p in enumerate(game.players)}
+            rows = (len(game.board) + game.board_width - 1) // game.board_width
+            self.board_rows = [game.render_board_row(r) for r in range(rows)]
+            self.hexes = [self.hex_json(h) for h in range(len(game.board))]
+            self.roads = [{'player': p.name, 'hexes': list(edge)} for p in game.players for edge in p.roads]
+            self.state_rows = [game.state_row(p) for p in game.players]
+            self.turn = game.turns_played
+            for part in PARTS:
+                self.versions[part] += 1
+
+    def hex_json(self, hex_number):
+        hex_ = self.game.board[hex_number]
+        owners = []
+        for owner in hex_['owner']:
+            building = 'city' if hex_number in owner.cities else 'settlement'
+            owners.append({'player': owner.name, 'building': building})
+        return {'hex': hex_number + 1, 'resource': hex_['resource'], 'number': hex_['number'], 'owners': owners}
+
+    def handle(self, event):
+        kind = event.kind
+        if kind == catan.STATE:
+            return
+        game = self.game
+        with self.lock:
+            if kind == catan.TURN:
+                self.turn = event.turn
+            elif kind == catan.BUILD:
+                data = event.data
+                if data['item'] == 'road':
+                    self.roads.append({'player': event.player.name, 'hexes': list(data['edge'])})
+                else:
+                    hex_number = data['hex']
+                    self.board_rows[hex_number // game.board_width] = game.render_board_row(hex_number // game.board_width)
+                    self.hexes[hex_number] = self.hex_json(hex_number)
+                self.versions['board'] += 1
+            elif kind == catan.GAME_OVER:
+                self.finished = True
+                self.winner = event.player.name
+            if kind in STATE_EVENTS:
+                self.refresh_row(event.player)
+                partner = event.data.get('partner') or event.data.get('previous')
+                if partner is not None:
+                    self.refresh_row(partner)
+                self.versions['state'] += 1
+            self.log.append(event.to_dict())
+            self.versions['log'] += 1
+
+    def refresh_row(self, player):
+        self.state_rows[self.seats[id(player)]] = self.game.state_row(player)
+
+    def close(self):
+        with self.lock:
+            self.finished = True
+            self.versions['log'] += 1
+
+    def etag(self, part, fmt):
+        version = self.versions[part] if part in PARTS else ".".join(str(self.versions[p]) for p in PARTS)
+        return f'"{self.id}-{part}-{fmt}-{version}"'
+
+    def render(self, part, fmt):
+        # (etag, body) for a part ('all' for everything), rendered at most once per version
+        with self.lock:
+            etag = self.etag(part, fmt)
+            cached = self.cache.get((part, fmt))
+            if cached is not None and cached[0] == etag:
+                return cached
+            if fmt == 'text':
+                body = self.render_text(part).encode()
+            else:
+                body = json.dumps(self.render_json(part)).encode()
+            self.cache[(part, fmt)] = (etag, body)
+            return etag, body
+
+    def render_json(self, part):
+        if part == 'board':
+            return {'width': self.game.board_width, 'hexes': self.hexes, 'roads': self.roads}
+        if part == 'state':
+            players = []
+            for row in self.state_rows:
+                name, *counts, settlements, cities, roads, points = row
+                players.append({
+                    'name': name,
+                    'resources': dict(zip(catan.RESOURCES, counts)),
+                    'settlements': settlements,
+                    'cities': cities,
+                    'roads': roads,
+                    'victory_points': points,
+                })
+            return {'players': players}
+        if part == 'log':
+            return {'events': list(self.log)}
+        return dict(self.summary(), board=self.render_json('board'), state=self.render_json('state'),
+                    log=self.render_json('log'))
+
+    def render_text(self, part):
+        if part == 'board':
+            # The same text as Game.render_board
+            return "\n".join(["\n--- Board ---"] + self.board_rows)
+        if part == 'state':
+            return catan.render_state_table(self.state_rows)
+        if part == 'log':
+            lines = (catan_server.describe(row) for row in self.log)
+            return "\n".join(line for line in lines if line is not None)
+        header = f"Game {self.id}, turn {self.turn}" + (f", won by {self.winner}" if self.winner else "")
+        return "\n".join([header, self.render_text('board'), self.render_text('state'), self.render_text('log')])
+
+    def summary(self):
+        return {
+            'id': self.id,
+            'seed': self.game.seed,
+            'turn': self.turn,
+            'finished': self.finished,
+            'winner': self.winner,
+            'players': [p.name for p in self.game.players],
+            'version': ".".join(str(self.versions[p]) for p in PARTS),
+        }
+
+
+class Spectators:
+    # The games being watched, by id; safe to use from game and HTTP threads
+    def __init__(self, log_size=50, keep_finished=100):
+        self.log_size = log_size
+        self.keep_finished = keep_finished
+        self.views = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def view(self):
+        # A view for a new game: pass it in the game's sinks
+        with self.lock:
+            view = GameView(next(self.ids), self.log_size)
+            self.views[view.id] = view
+            finished = [v.id for v in self.views.values() if v.finished]
+            for game_id in finished[:max(0, len(finished) - self.keep_finished)]:
+                del self.views[game_id]
+        return view
+
+    def watch(self, game):
+        # Starts watching a game that is already running
+        view = self.view()
+        game.events.add(view)
+        view.attach(game)
+        return view
+
+    def get(self, game_id):
+        with self.lock:
+            return self.views.get(game_id)
+
+    def summaries(self):
+        with self.lock:
+            views = list(self.views.values())
+        summaries = []
+        for view in views:
+            with view.lock:
+                if view.game is not None:
+                    summaries.append(view.summary())
+        return summaries
+
+
+class SpectatorHandler(BaseHTTPRequestHandler):
+    spectators = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        fmt = 'text' if parse_qs(url.query).get('format') == ['text'] else 'json'
+        parts = [p for p in url.path.split('/') if p]
+        if parts == ['games']:
+            self.send_body(json.dumps(self.spectators.summaries()).encode(), 'json')
+            return
+        if len(parts) not in (2, 3) or parts[0] != 'games' or not parts[1].isdigit():
+            self.send_error(404)
+            return
+        view = self.spectators.get(int(parts[1]))
+        part = parts[2] if len(parts) == 3 else 'all'
+        if view is None or view.game is None or (part != 'all' and part not in PARTS):
+            self.send_error(404)
+            return
+        with view.lock:
+            etag = view.etag(part, fmt)
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        etag, body = view.render(part, fmt)
+        self.send_body(body, fmt, etag)
+
+    def send_body(self, body, fmt, etag=None):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8' if fmt == 'text' else 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if etag is not None:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(spectators, host="127.0.0.1", port=8080):
+    # Starts the HTTP server in a background thread and returns it
+    handler = type('Handler', (SpectatorHandler,), {'spectators': spectators})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class Pace(catan.Sink):
+    # Slows a game down to a turn every `delay` seconds, so there is something to watch
+    def __init__(self, delay):
+        self.delay = delay
+
+    def handle(self, event):
+        if event.kind == catan.TURN:
+            time.sleep(self.delay)
+
+
+def play_game(game, max_turns):
+    # Closes the game's sinks even when max_turns stops it, so its view shows it finished
+    game.play(max_turns=max_turns)
+    game.close()
+
+
+def run_games(spectators, games=10, seed=0, delay=0.0, max_turns=2000, personalities=("generous", "greedy", "fair")):
+    # Plays seeded all-AI games in background threads, each watched by spectators
+    threads = []
+    for n in range(games):
+        sinks = [spectators.view()]
+        if delay:
+            sinks.append(Pace(delay))
+        game = catan.Game(seed=catan.derive_seed(seed, 'spectator', n), personalities=personalities, sinks=sinks)
+        thread = threading.Thread(target=play_game, args=(game, max_turns), daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Watch running Catan games over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("-n", "--games", type=int, default=10, help="all-AI games to play while serving")
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("--delay", type=float, default=0.5, help="seconds between turns")
+    args = parser.parse_args()
+
+    spectators = Spectators()
+    server = serve(spectators, args.host, args.port)
+    run_games(spectators, args.games, args.seed, args.delay)
+    print(f"Watching {args.games} games on http://{args.host}:{server.server_address[1]}/games")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
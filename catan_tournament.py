@@ -0,0 +1,155 @@
+#!/usr/bin/python3.11
+# Runs many headless all-AI games of catan.py across a process pool and
+# reports how the AI personalities fare against each other.
+
+import argparse
+import itertools
+import math
+import multiprocessing
+
+import catan
+
+PERSONALITIES = ("generous", "greedy", "fair")
+
+
+def lineups(personalities):
+    # Every seat order of the personalities, so each one plays from each seat equally often
+    return list(itertools.permutations(personalities))
+
+
+def new_stats():
+    return {
+        'games': 0,
+        'finished': 0,
+        'turns': 0,
+        'turns_sq': 0,
+        'wins': {},
+        'appearances': {},
+        'seat_wins': {},
+    }
+
+
+def game_seed(seed, game_number):
+    # Every game gets its own stream derived from the tournament seed and its number,
+    # so results do not depend on which worker plays it or in what order
+    return catan.derive_seed(seed, 'game', game_number)
+
+
+def play_batch(task):
+    lineup, seed, first_game, count, max_turns = task
+    stats = new_stats()
+    for game_number in range(first_game, first_game + count):
+        result = catan.simulate(seed=game_seed(seed, game_number), personalities=lineup, max_turns=max_turns)
+        stats['games'] += 1
+        stats['turns'] += result.turns
+        stats['turns_sq'] += result.turns * result.turns
+        for personality in lineup:
+            stats['appearances'][personality] = stats['appearances'].get(personality, 0) + 1
+        if result.winner is not None:
+            seat = result.winner_seat
+            stats['finished'] += 1
+            stats['wins'][result.winner.personality] = stats['wins'].get(result.winner.personality, 0) + 1
+            stats['seat_wins'][seat] = stats['seat_wins'].get(seat, 0) + 1
+    return stats
+
+
+def merge(total, part):
+    for key in ('games', 'finished', 'turns', 'turns_sq'):
+        total[key] += part[key]
+    for key in ('wins', 'appearances', 'seat_wins'):
+        for k, v in part[key].items():
+            total[key][k] = total[key].get(k, 0) + v
+    return total
+
+
+def wilson_interval(wins, games, z=1.96):
+    if games == 0:
+        return (0.0, 0.0)
+    p = wins / games
+    denom = 1 + z * z / games
+    centre = (p + z * z / (2 * games)) / denom
+    half = z * math.sqrt(p * (1 - p) / games + z * z / (4 * games * games)) / denom
+    return (centre - half, centre + half)
+
+
+def mean_interval(total, total_sq, n, z=1.96):
+    if n == 0:
+        return (0.0, 0.0, 0.0)
+    mean = total / n
+    variance = max(0.0, total_sq / n - mean * mean)
+    half = z * math.sqrt(variance / n) if n > 1 else 0.0
+    return (mean, mean - half, mean + half)
+
+
+def make_tasks(games, personalities, seed, chunk_size, max_turns):
+    orders = lineups(personalities)
+    tasks = []
+    for i, start in enumerate(range(0, games, chunk_size)):
+        count = min(chunk_size, games - start)
+        tasks.append((orders[i % len(orders)], seed, start, count, max_turns))
+    return tasks
+
+
+def run_tournament(games=1200, personalities=PERSONALITIES, processes=None, seed=0, chunk_size=50, max_turns=2000):
+    tasks = make_tasks(games, personalities, seed, chunk_size, max_turns)
+    total = new_stats()
+    if processes == 1:
+        for part in map(play_batch, tasks):
+            merge(total, part)
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            for part in pool.imap_unordered(play_batch, tasks):
+                merge(total, part)
+    return summarize(total)
+
+
+def summarize(total):
+    summary = {
+        'games': total['games'],
+        'finished': total['finished'],
+        'personalities': {},
+        'seats': {},
+    }
+    mean, low, high = mean_interval(total['turns'], total['turns_sq'], total['games'])
+    summary['avg_turns'] = {'mean': mean, 'ci95': (low, high)}
+    for personality, played in sorted(total['appearances'].items()):
+        wins = total['wins'].get(personality, 0)
+        summary['personalities'][personality] = {
+            'games': played,
+            'wins': wins,
+            'win_rate': wins / played if played else 0.0,
+            'ci95': wilson_interval(wins, played),
+        }
+    for seat, wins in sorted(total['seat_wins'].items()):
+        summary['seats'][seat] = {
+            'wins': wins,
+            'win_rate': wins / total['games'],
+            'ci95': wilson_interval(wins, total['games']),
+        }
+    return summary
+
+
+def print_summary(summary):
+    print(f"Games played: {summary['games']} ({summary['finished']} finished)")
+    avg = summary['avg_turns']
+    print(f"Average game length: {avg['mean']:.1f} turns (95% CI {avg['ci95'][0]:.1f} - {avg['ci95'][1]:.1f})")
+    print("\n--- Personalities ---")
+    for personality, row in summary['personalities'].items():
+        low, high = row['ci95']
+        print(f"{personality:<10} won {row['wins']:>6} of {row['games']:>6}  {row['win_rate']:6.1%}  (95% CI {low:.1%} - {high:.1%})")
+    print("\n--- Seats ---")
+    for seat, row in summary['seats'].items():
+        low, high = row['ci95']
+        print(f"Seat {seat + 1:<5} won {row['wins']:>6}  {row['win_rate']:6.1%}  (95% CI {low:.1%} - {high:.1%})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run an all-AI Catan tournament across CPU cores.")
+    parser.add_argument("-n", "--games", type=int, default=1200)
+    parser.add_argument("-p", "--processes", type=int, default=None)
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=50)
+    parser.add_argument("--max-turns", type=int, default=2000)
+    parser.add_argument("--personalities", nargs="+", default=list(PERSONALITIES))
+    args = parser.parse_args()
+    print_summary(run_tournament(args.games, tuple(args.personalities), args.processes, args.seed, args.chunk_size, args.max_turns))